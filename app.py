@@ -1,22 +1,87 @@
 import pytesseract
-from pdf2image import convert_from_bytes
-from PyPDF2 import PdfReader
-from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+import pypdf
+import PyPDF2
+from PIL import Image, ImageStat
 import io
 import re
+import json
+import csv
+import logging
+import mmap
+import contextlib
+import difflib
+import itertools
+import math
+import copy
+import posixpath
+import hashlib
+import sqlite3
+import uuid
+import contextvars
+import multiprocessing
 import os
 import subprocess
+import shutil
+import signal
+import tempfile
+import asyncio
+import threading
+import queue
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, deque
 from docx import Document
 from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
 from pptx import Presentation
-from fastapi.responses import StreamingResponse
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from lxml import etree
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.background import BackgroundTask
+from starlette.exceptions import HTTPException
+from starlette.formparsers import MultiPartParser, MultiPartException
+from starlette.requests import Request
+from fastapi.routing import APIRoute
 from docx.shared import Pt
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
 import zipfile
 from io import BytesIO
+from typing import List, Optional
 
 app = FastAPI()
 
+# Largest single upload accepted; batch requests may carry up to MAX_BATCH_REQUEST_BYTES
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+MAX_BATCH_REQUEST_BYTES = int(os.environ.get("MAX_BATCH_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+
+
+# Registered before CORS so the 413 still carries CORS headers
+def request_body_limit(path):
+    # Allows some room for the multipart framing around the file itself
+    limit = MAX_BATCH_REQUEST_BYTES if path == "/extract_batch/" else MAX_UPLOAD_BYTES
+    return limit + 64 * 1024
+
+
+@app.middleware("http")
+async def reject_oversized_requests(request, call_next):
+    # Rejects on Content-Length before the body is read. Chunked uploads (no
+    # Content-Length) are rejected while they stream in, as soon as they
+    # cross the limit (see SpoolingMultiPartParser).
+    limit = MAX_BATCH_REQUEST_BYTES if request.url.path == "/extract_batch/" else MAX_UPLOAD_BYTES
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > request_body_limit(request.url.path):
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"Request body is larger than the {limit} byte limit."},
+        )
+    return await call_next(request)
+
 # Allow your web app to access this API
 app.add_middleware(
     CORSMiddleware,
@@ -26,284 +91,3536 @@ app.add_middleware(
 )
 
 
-# ======================================================
-# HELPER FUNCTIONS (OCR + PDF + DOCX + TXT)
-# ======================================================
-def clean_text(text):
-    text = re.sub(r'\n\s*\n', '\n\n', text)
-    text = text.replace("\t", " ")
-    return text.strip()
+# ======================================================
+# METRICS (Prometheus text format at /metrics)
+# ======================================================
+logger = logging.getLogger("app")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def record(self, amount, labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def record(self, value, labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for key, state in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, state):
+                yield f"{self.name}_bucket", {**labels, "le": repr(float(bound))}, count
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, state[-1]
+            yield f"{self.name}_sum", labels, state[-2]
+            yield f"{self.name}_count", labels, state[-1]
+
+
+class Observed:
+    """A gauge (or counter kept elsewhere) read from a callback at scrape time."""
+
+    def __init__(self, name, help, func, type="gauge", labelname=None):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.type = type
+        # With a label, func returns {label value: value}
+        self.labelname = labelname
+
+    def samples(self):
+        if self.labelname is None:
+            yield self.name, {}, self.func()
+            return
+        for key, value in sorted(self.func().items()):
+            yield self.name, {self.labelname: key}, value
+
+
+METRICS = {}
+
+
+def register_metric(metric):
+    METRICS[metric.name] = metric
+    return metric
+
+
+http_request_seconds = register_metric(Histogram(
+    "http_request_duration_seconds",
+    "Time until the response starts, by route and status.",
+    ("method", "route", "status"),
+))
+stage_seconds = register_metric(Histogram(
+    "extraction_stage_seconds",
+    "Time spent in each processing stage (per page for text layer, OCR and preprocessing).",
+    ("stage",),
+))
+register_metric(Counter("upload_bytes_total", "Bytes of uploaded documents spooled.", ("kind",)))
+register_metric(Counter("extracted_pages_total", "PDF pages extracted, by source.", ("source",)))
+register_metric(Counter("extracted_slides_total", "Slides extracted, by format.", ("format",)))
+register_metric(Counter("ocr_blank_pages_total", "Pages whose OCR was skipped as blank."))
+
+
+def record_metric(name, value=1, **labels):
+    # Inside an extraction worker process the metric is sent to the API
+    # process with the other worker events, so /metrics covers all workers.
+    if _in_pool_worker:
+        _worker_events.put(("metric", name, value, labels))
+    else:
+        METRICS[name].record(value, labels)
+
+
+def observe_stage(stage, seconds):
+    record_metric("extraction_stage_seconds", seconds, stage=stage)
+
+
+@contextlib.contextmanager
+def timed_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timed_iter(stage, iterable):
+    # Times only the work of producing the items, not what the caller does
+    # between them, and records the total once the iteration ends.
+    elapsed = 0.0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        observe_stage(stage, elapsed)
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Outermost middleware, so rejected and failed requests are timed too
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (/jobs/{job_id}), not by the raw path
+        route = request.scope.get("route")
+        http_request_seconds.record(time.perf_counter() - start, {
+            "method": request.method,
+            "route": route.path if route is not None else "unmatched",
+            "status": status,
+        })
+
+
+# ======================================================
+# HELPER FUNCTIONS (OCR + PDF + DOCX + TXT)
+# ======================================================
+# Rasterization settings for scanned PDFs (passed through to pdftoppm)
+OCR_DPI = int(os.environ.get("OCR_DPI", "200"))
+PDF_RENDER_THREADS = int(os.environ.get("PDF_RENDER_THREADS", "4"))
+# Extraction worker processes (see EXTRACTION WORKER POOL); OCR threads run
+# inside each of them
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", os.cpu_count() or 1))
+# Extractions that OCR (scanned PDFs, images, .pptx with ocr_images) admitted
+# at once, see ADMISSION CONTROL. By default a quarter of the CPUs, leaving at
+# least one worker free for the cheaper classes.
+ADMIT_OCR_CONCURRENCY = int(os.environ.get(
+    "ADMIT_OCR_CONCURRENCY", max(1, min(EXTRACT_WORKERS - 1, (os.cpu_count() or 1) // 4))
+))
+# Number of pages OCR'd at once for a single PDF, per worker process. The
+# default shares the CPUs between the extractions allowed to OCR at once, so
+# a single scanned PDF still OCRs several pages in parallel without running
+# workers x CPUs tesseracts (and rendered pages) when they are all busy.
+OCR_THREADS = int(os.environ.get("OCR_THREADS", max(1, (os.cpu_count() or 1) // ADMIT_OCR_CONCURRENCY)))
+# Pages rendered per window while OCRing; 0 renders the whole PDF at once
+PDF_RENDER_WINDOW = int(os.environ.get("PDF_RENDER_WINDOW", OCR_THREADS))
+# Pages whose text layer is shorter than this are treated as scanned
+PDF_MIN_PAGE_CHARS = int(os.environ.get("PDF_MIN_PAGE_CHARS", "20"))
+
+# Parallelism comes from running one tesseract per page, so keep each
+# tesseract process on a single core instead of letting OpenMP oversubscribe.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+def clean_text(text):
+    text = re.sub(r'\n\s*\n', '\n\n', text)
+    text = text.replace("\t", " ")
+    return text.strip()
+
+
+# Extractors take their input ("source") either as bytes or as a file path.
+# Paths are memory-mapped or handed to the underlying library directly, so
+# large uploads spooled to disk are never copied into memory as a whole.
+def path_or_stream(source):
+    # For libraries that open paths themselves and read lazily (zipfile-based
+    # pptx/docx, PIL). zipfile can't take an mmap: it needs seekable().
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return source
+
+
+def open_source(source):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    with open(source, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return io.BytesIO(b"")  # empty files can't be mapped
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_source(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+# PDF text layer backends. PDF_TEXT_BACKEND picks the default; requests can
+# choose another one. Each backend's read(pdf_path) returns the page count
+# and an iterator over the text of each page, in order. "auto" is PyPDF2, the
+# fastest of the backends measured by test/pdf_backend_benchmark.py; pdftotext
+# has not been benchmarked yet and must be picked explicitly.
+PDF_TEXT_BACKEND = os.environ.get("PDF_TEXT_BACKEND", "auto")
+# Pages per pdftotext run
+PDF_TEXT_WINDOW = int(os.environ.get("PDF_TEXT_WINDOW", "32"))
+PDF_TEXT_TIMEOUT = float(os.environ.get("PDF_TEXT_TIMEOUT", "120"))
+
+
+class PdfTextError(Exception):
+    pass
+
+
+class PyPdfTextBackend:
+    """In-process extraction with pypdf, or PyPDF2 which has the same API."""
+
+    def __init__(self, name, reader_class):
+        self.name = name
+        self.reader_class = reader_class
+
+    def read(self, pdf_path):
+        pages = self.reader_class(open_source(pdf_path)).pages
+        return len(pages), self._iter_texts(pages)
+
+    def _iter_texts(self, pages):
+        for number, page in enumerate(pages, start=1):
+            try:
+                yield page.extract_text() or ""
+            except Exception as e:
+                # The page is treated as having no text layer (and OCR'd)
+                logger.warning("%s could not read the text of page %d: %s", self.name, number, e)
+                yield ""
+
+
+class PdftotextBackend:
+    """poppler's pdftotext, run on PDF_TEXT_WINDOW pages at a time."""
+
+    name = "pdftotext"
+
+    def read(self, pdf_path):
+        total = pdfinfo_from_path(pdf_path, timeout=time_left())["Pages"]
+        return total, self._iter_texts(pdf_path, total)
+
+    def _iter_texts(self, pdf_path, total):
+        for first in range(1, total + 1, PDF_TEXT_WINDOW):
+            last = min(total, first + PDF_TEXT_WINDOW - 1)
+            result = subprocess.run(
+                ["pdftotext", "-q", "-enc", "UTF-8", "-f", str(first), "-l", str(last), pdf_path, "-"],
+                capture_output=True,
+                timeout=min(PDF_TEXT_TIMEOUT, time_left() or PDF_TEXT_TIMEOUT),
+            )
+            if result.returncode != 0:
+                raise PdfTextError(f"pdftotext exited with {result.returncode}: {result.stderr.decode(errors='replace')}")
+
+            # Every page ends with a form feed
+            texts = result.stdout.decode("utf-8", "replace").split("\f")
+            for i in range(last - first + 1):
+                yield texts[i] if i < len(texts) else ""
+
+
+PDF_TEXT_BACKENDS = {
+    "pypdf": PyPdfTextBackend("pypdf", pypdf.PdfReader),
+    "pypdf2": PyPdfTextBackend("pypdf2", PyPDF2.PdfReader),
+    "pdftotext": PdftotextBackend(),
+}
+
+
+def get_pdf_text_backend(name=None):
+    name = name or PDF_TEXT_BACKEND
+    if name == "auto":
+        name = "pypdf2"
+    if name not in PDF_TEXT_BACKENDS:
+        choices = ", ".join(["auto", *PDF_TEXT_BACKENDS])
+        raise ValueError(f"Unknown PDF text backend: {name} (choose from {choices})")
+    return PDF_TEXT_BACKENDS[name]
+
+
+# Image preprocessing before OCR. OCR_PREPROCESS is a comma-separated list of
+# steps: downscale, binarize, deskew, blank (skip OCR on empty pages; opt-in,
+# since a page can hold no more than a short heading).
+OCR_PREPROCESS = frozenset(
+    step.strip() for step in os.environ.get("OCR_PREPROCESS", "downscale").split(",") if step.strip()
+)
+# Images with a known resolution above this are scaled down to it
+OCR_TARGET_DPI = int(os.environ.get("OCR_TARGET_DPI", "300"))
+# Images without a usable resolution (phone photos) are capped to this size
+OCR_MAX_SIDE = int(os.environ.get("OCR_MAX_SIDE", "2500"))
+# Resolutions below this are placeholders (cameras and screenshot tools write
+# 72 or 96 dpi), not the scan's, and count as no resolution
+OCR_MIN_DPI = int(os.environ.get("OCR_MIN_DPI", "100"))
+# Pages with fewer dark pixels than this (at the resolution OCR'd) count as
+# blank; a short word in a small font is a few hundred
+OCR_BLANK_INK_PIXELS = int(os.environ.get("OCR_BLANK_INK_PIXELS", "50"))
+OCR_MAX_SKEW = float(os.environ.get("OCR_MAX_SKEW", "5"))
+
+
+def ocr_options(lang=None):
+    # OCR settings that change the text produced, for result cache keys
+    options = {
+        "preprocess": sorted(OCR_PREPROCESS),
+        "target_dpi": OCR_TARGET_DPI,
+        "max_side": OCR_MAX_SIDE,
+        "min_dpi": OCR_MIN_DPI,
+        "lang": lang or OCR_LANG,
+    }
+    if options["lang"] == "auto":
+        options["auto_langs"] = ocr_auto_langs()
+    return options
+
+
+def otsu_threshold(gray: Image.Image):
+    # Threshold that best separates the histogram into ink and paper
+    hist = gray.histogram()
+    total = sum(hist)
+    sum_all = sum(i * count for i, count in enumerate(hist))
+
+    best, best_var = 127, -1.0
+    weight_bg = sum_bg = 0
+    for i, count in enumerate(hist):
+        weight_bg += count
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += i * count
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        between_var = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if between_var > best_var:
+            best, best_var = i, between_var
+    return best
+
+
+def downscale_for_ocr(gray: Image.Image):
+    dpi = gray.info.get("dpi", (0, 0))[0]
+    if dpi and dpi >= OCR_MIN_DPI:
+        # Known resolution: only ever brought down to OCR_TARGET_DPI, however
+        # large the page
+        scale = OCR_TARGET_DPI / dpi
+    else:
+        scale = OCR_MAX_SIDE / max(gray.size)
+
+    if scale >= 1:
+        return gray
+    size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+    return gray.resize(size, Image.Resampling.LANCZOS)
+
+
+def is_blank_page(gray: Image.Image):
+    # Counted on the full image: on a thumbnail a lone heading averages out
+    # to grey and looks like paper
+    if ImageStat.Stat(gray).stddev[0] < 1:
+        return True
+    # Only pixels darker than mid-grey count, so shading and scanner noise
+    # on an empty page don't
+    threshold = min(otsu_threshold(gray), 127)
+    ink = sum(gray.histogram()[:threshold + 1])
+    return ink < OCR_BLANK_INK_PIXELS
+
+
+def estimate_skew(gray: Image.Image):
+    # Projection profile: text lines are straightest where the row sums of
+    # the ink vary the most. Works on a small inverted copy (ink = white) so
+    # the corners exposed by rotating add no ink.
+    thumb = gray.copy()
+    thumb.thumbnail((1024, 1024))
+    threshold = otsu_threshold(thumb)
+    ink = thumb.point(lambda v: 255 if v <= threshold else 0)
+
+    def score(angle):
+        rotated = ink.rotate(angle, resample=Image.Resampling.BILINEAR)
+        rows = rotated.resize((1, rotated.height), Image.Resampling.BOX)
+        return ImageStat.Stat(rows).var[0]
+
+    def best_of(angles):
+        return max(angles, key=score)
+
+    steps = int(OCR_MAX_SKEW)
+    coarse = best_of([float(a) for a in range(-steps, steps + 1)])
+    return best_of([coarse + a / 10 for a in range(-9, 10)])
+
+
+def preprocess_for_ocr(image: Image.Image):
+    """
+    Prepares an image for Tesseract according to OCR_PREPROCESS.
+
+    Returns:
+        Image.Image | None: the grayscale (or binarized) image to OCR, or
+        None if the page is blank and OCR can be skipped.
+    """
+    gray = image.convert("L")
+
+    if "downscale" in OCR_PREPROCESS:
+        gray = downscale_for_ocr(gray)
+
+    if "blank" in OCR_PREPROCESS and is_blank_page(gray):
+        return None
+
+    if "deskew" in OCR_PREPROCESS:
+        angle = estimate_skew(gray)
+        if abs(angle) >= 0.2:
+            gray = gray.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+
+    if "binarize" in OCR_PREPROCESS:
+        threshold = otsu_threshold(gray)
+        gray = gray.point(lambda v: 255 if v > threshold else 0)
+
+    return gray
+
+
+# OCR backend: "tesserocr" keeps an initialized Tesseract API per OCR thread
+# and passes images in memory; "pytesseract" runs the tesseract CLI per image.
+# "auto" uses tesserocr when it is installed (it is optional: the Docker image
+# installs it, requirements.txt does not since it needs libtesseract headers).
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "auto")
+# Default OCR language(s) when a request doesn't pick one: a Tesseract
+# language ("eng"), several joined with "+" ("eng+deu"), or "auto"
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+# Candidates for "auto" (those not installed are ignored)
+OCR_AUTO_LANGS = [
+    lang.strip() for lang in os.environ.get("OCR_AUTO_LANGS", "eng,deu,fra,spa,ita,por").split(",") if lang.strip()
+]
+# "auto" OCRs this many sample pages/pictures at low resolution with every
+# candidate, then uses only the languages that recognized them best
+OCR_DETECT_SAMPLES = int(os.environ.get("OCR_DETECT_SAMPLES", "3"))
+OCR_DETECT_DPI = int(os.environ.get("OCR_DETECT_DPI", "150"))
+OCR_DETECT_MAX_SIDE = int(os.environ.get("OCR_DETECT_MAX_SIDE", "1600"))
+# Samples whose best mean word confidence (0-100) is below this don't count
+OCR_DETECT_MIN_CONFIDENCE = float(os.environ.get("OCR_DETECT_MIN_CONFIDENCE", "40"))
+# Warm engines kept per OCR thread (tesserocr); least recently used go first.
+# Language detection runs on a thread of its own, which keeps one engine per
+# OCR_AUTO_LANGS candidate, so page OCR threads only load the languages used.
+OCR_ENGINES_PER_THREAD = int(os.environ.get("OCR_ENGINES_PER_THREAD", "4"))
+
+# Imported after OMP_THREAD_LIMIT is set, since libtesseract reads it on load
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+_ocr_engines = threading.local()
+_ocr_executor = None
+_ocr_executor_pid = None
+_detect_executor = None
+_detect_executor_pid = None
+# Languages tesserocr couldn't load; these go to pytesseract instead
+_tesserocr_failed_langs = set()
+
+
+def use_tesserocr():
+    if OCR_BACKEND == "pytesseract":
+        return False
+    if tesserocr is None:
+        if OCR_BACKEND == "tesserocr":
+            raise RuntimeError("OCR_BACKEND=tesserocr but tesserocr is not installed")
+        return False
+    return True
+
+
+def _tesserocr_engine(lang):
+    # One engine per thread and language; loading traineddata is the slow part
+    engines = getattr(_ocr_engines, "engines", None)
+    if engines is None:
+        engines = _ocr_engines.engines = OrderedDict()
+    if lang in engines:
+        engines.move_to_end(lang)
+        return engines[lang]
+
+    engines[lang] = tesserocr.PyTessBaseAPI(lang=lang)
+    while len(engines) > getattr(_ocr_engines, "capacity", OCR_ENGINES_PER_THREAD):
+        engines.popitem(last=False)[1].End()
+    return engines[lang]
+
+
+def _tesserocr_api(lang):
+    # The thread's engine for lang, or None to use pytesseract instead
+    if not use_tesserocr() or lang in _tesserocr_failed_langs:
+        return None
+    try:
+        return _tesserocr_engine(lang)
+    except RuntimeError as e:
+        # Usually missing tessdata for the library build; the CLI may still work
+        logger.warning("⚠️ tesserocr can't load %s, falling back to pytesseract for it: %s", lang, e)
+        _tesserocr_failed_langs.add(lang)
+        return None
+
+
+def _recognize(api):
+    # Recognize() within what is left of the pool task's deadline (if any)
+    left = time_left()
+    if not api.Recognize(0 if left is None else max(1, int(left * 1000))):
+        raise ExtractionTimeoutError("Tesseract did not finish in time.")
+
+
+def run_tesseract(image: Image.Image, lang="eng"):
+    api = _tesserocr_api(lang)
+    if api is not None:
+        try:
+            api.SetImage(image)
+            _recognize(api)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+
+    return pytesseract.image_to_string(image, lang=lang, timeout=time_left() or 0)
+
+
+def ocr_confidence(image: Image.Image, lang):
+    """Returns (mean word confidence 0-100, word count) of OCRing image in lang."""
+    api = _tesserocr_api(lang)
+    if api is not None:
+        try:
+            api.SetImage(image)
+            _recognize(api)
+            confidences = api.AllWordConfidences()
+        finally:
+            api.Clear()
+    else:
+        data = pytesseract.image_to_data(
+            image, lang=lang, output_type=pytesseract.Output.DICT, timeout=time_left() or 0,
+        )
+        confidences = [
+            float(conf) for conf, text in zip(data["conf"], data["text"])
+            if float(conf) >= 0 and text.strip()
+        ]
+    if not confidences:
+        return 0.0, 0
+    return sum(confidences) / len(confidences), len(confidences)
+
+
+_installed_ocr_langs = None
+_installed_ocr_langs_listed = False
+
+
+def installed_ocr_langs():
+    # None when Tesseract can't be asked (the languages are then not checked)
+    global _installed_ocr_langs, _installed_ocr_langs_listed
+    if not _installed_ocr_langs_listed:
+        _installed_ocr_langs_listed = True
+        try:
+            if use_tesserocr():
+                _installed_ocr_langs = frozenset(tesserocr.get_languages()[1])
+            else:
+                _installed_ocr_langs = frozenset(pytesseract.get_languages(config=""))
+        except Exception as e:
+            logger.warning("Could not list the installed OCR languages: %s", e)
+    return _installed_ocr_langs
+
+
+def ocr_auto_langs():
+    installed = installed_ocr_langs()
+    langs = [lang for lang in OCR_AUTO_LANGS if installed is None or lang in installed]
+    return langs or ["eng"]
+
+
+def check_ocr_lang(lang):
+    """
+    Returns the OCR language setting for a request (OCR_LANG if lang is None).
+
+    Raises:
+        ValueError: lang isn't "auto" or installed Tesseract languages.
+    """
+    lang = lang or OCR_LANG
+    if lang == "auto":
+        return lang
+    if not re.fullmatch(r"[A-Za-z0-9_]+(\+[A-Za-z0-9_]+)*", lang):
+        raise ValueError(f"Invalid OCR language: {lang!r}")
+    installed = installed_ocr_langs()
+    missing = [code for code in lang.split("+") if installed is not None and code not in installed]
+    if missing:
+        raise ValueError(f"OCR language not installed: {', '.join(missing)}")
+    return lang
+
+
+def _detection_sample(image: Image.Image):
+    # Low resolution is enough to tell languages apart; None for blank images
+    gray = image.convert("L")
+    gray.thumbnail((OCR_DETECT_MAX_SIDE, OCR_DETECT_MAX_SIDE))
+    return None if is_blank_page(gray) else gray
+
+
+def detect_ocr_lang(images):
+    """
+    Picks the OCR languages for a document from a few sample images.
+
+    Each sample is OCR'd at low resolution with every candidate language (see
+    OCR_AUTO_LANGS) and goes to the one with the best mean word confidence.
+    The languages that won a sample are returned joined with "+", most
+    frequent first, so mixed documents get a combined model.
+    """
+    candidates = ocr_auto_langs()
+    samples = [sample for sample in map(_detection_sample, images) if sample is not None]
+    if len(candidates) == 1 or not samples:
+        return candidates[0]
+
+    with timed_stage("ocr_detect_lang"):
+        trials = [(sample, lang) for sample in samples for lang in candidates]
+        scores = list(get_detect_executor().map(lambda trial: ocr_confidence(*trial), trials))
+
+    wins = {}
+    for i in range(len(samples)):
+        sample_scores = scores[i * len(candidates):(i + 1) * len(candidates)]
+        (confidence, _words), lang = max(zip(sample_scores, candidates))
+        if confidence >= OCR_DETECT_MIN_CONFIDENCE:
+            wins[lang] = wins.get(lang, 0) + 1
+
+    if not wins:
+        return candidates[0]
+    return "+".join(sorted(wins, key=lambda lang: (-wins[lang], candidates.index(lang))))
+
+
+def get_ocr_executor():
+    # Long-lived so each OCR thread keeps its engines between documents.
+    # Threads don't survive fork, so a forked worker process builds its own.
+    global _ocr_executor, _ocr_executor_pid
+    if _ocr_executor is None or _ocr_executor_pid != os.getpid():
+        _ocr_executor = ThreadPoolExecutor(max_workers=OCR_THREADS, thread_name_prefix="ocr")
+        _ocr_executor_pid = os.getpid()
+    return _ocr_executor
+
+
+def _init_detect_thread():
+    _ocr_engines.capacity = max(OCR_ENGINES_PER_THREAD, len(OCR_AUTO_LANGS))
+
+
+def get_detect_executor():
+    # The one thread per process that runs language detection (see OCR_ENGINES_PER_THREAD)
+    global _detect_executor, _detect_executor_pid
+    if _detect_executor is None or _detect_executor_pid != os.getpid():
+        _detect_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="ocr-detect", initializer=_init_detect_thread,
+        )
+        _detect_executor_pid = os.getpid()
+    return _detect_executor
+
+
+def ocr_image(image: Image.Image, lang=None):
+    # lang: as for check_ocr_lang; "auto" detects it from the image itself
+    lang = lang or OCR_LANG
+    with timed_stage("ocr_preprocess"):
+        prepared = preprocess_for_ocr(image)
+    if prepared is None:
+        record_metric("ocr_blank_pages_total")
+        return ""
+    if lang == "auto":
+        lang = detect_ocr_lang([prepared])
+    with timed_stage("ocr_page"):
+        return run_tesseract(prepared, lang=lang)
+
+
+def _page_windows(pages, window):
+    # Groups sorted page numbers into (first_page, last_page) runs of at most
+    # `window` consecutive pages, so pdftoppm only renders what was asked for.
+    run = []
+    for page in pages:
+        if run and (page != run[-1] + 1 or len(run) == window):
+            yield run[0], run[-1]
+            run = []
+        run.append(page)
+    if run:
+        yield run[0], run[-1]
+
+
+@contextlib.contextmanager
+def pdf_on_disk(source):
+    # pdftoppm needs a file; bytes are written to a temp file once
+    if not isinstance(source, (bytes, bytearray)):
+        yield source
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "document.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(source)
+        yield pdf_path
+
+
+def iter_pdf_page_windows(source, dpi=OCR_DPI, thread_count=PDF_RENDER_THREADS,
+                          window=PDF_RENDER_WINDOW, pages=None):
+    """
+    Rasterizes a PDF (or only the 1-based `pages` of it) a few pages at a time.
+
+    Pages are rendered by pdftoppm into a temp dir and opened lazily. The
+    images of a window are closed and their files deleted as soon as the
+    caller asks for the next window, so peak memory depends on the window
+    size rather than the page count.
+
+    Yields:
+        list[PIL.Image.Image]: The pages of each window, in page order.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir, pdf_on_disk(source) as pdf_path:
+        if pages is None:
+            pages = range(1, pdfinfo_from_path(pdf_path, timeout=time_left())["Pages"] + 1)
+        pages = sorted(pages)
+        if window <= 0:
+            window = len(pages)
+
+        for first_page, last_page in _page_windows(pages, window):
+            window_dir = tempfile.mkdtemp(dir=tmp_dir)
+            with timed_stage("rasterize"):
+                images = convert_from_path(
+                    pdf_path,
+                    dpi=dpi,
+                    first_page=first_page,
+                    last_page=last_page,
+                    output_folder=window_dir,
+                    thread_count=thread_count,
+                    timeout=time_left(),
+                )
+            for img in images:
+                # pdftoppm's images carry no resolution; downscale_for_ocr uses it
+                img.info["dpi"] = (dpi, dpi)
+            try:
+                yield images
+            finally:
+                for img in images:
+                    img.close()
+                shutil.rmtree(window_dir, ignore_errors=True)
+
+
+def detect_pdf_lang(source, pages):
+    # Renders a few of the pages, spread out, at low resolution for detect_ocr_lang
+    pages = sorted(pages)
+    step = max(1, len(pages) // OCR_DETECT_SAMPLES)
+    samples = []
+    for images in iter_pdf_page_windows(source, dpi=OCR_DETECT_DPI, pages=pages[::step][:OCR_DETECT_SAMPLES]):
+        samples.extend(image.convert("L") for image in images)
+    return detect_ocr_lang(samples)
+
+
+def ocr_pdf_pages(source, pages=None, dpi=OCR_DPI, thread_count=PDF_RENDER_THREADS, lang=None):
+    """
+    Rasterizes a PDF window by window and OCRs the pages of each window in parallel.
+
+    Args:
+        pages: 1-based page numbers to OCR. Defaults to every page.
+        lang: OCR language(s) (see check_ocr_lang), already detected if "auto".
+
+    Returns:
+        list[str]: The OCR text of each page, in page order.
+    """
+    texts = []
+    # Both backends release the GIL while Tesseract runs, so threads give
+    # real parallelism
+    executor = get_ocr_executor()
+    for images in iter_pdf_page_windows(source, dpi, thread_count, pages=pages):
+        texts.extend(executor.map(lambda image: ocr_image(image, lang), images))
+    return texts
+
+
+def iter_pdf_pages(source, backend=None, lang=None):
+    """
+    Extracts a PDF page by page, keeping the text layer where a page has one
+    and OCRing only the pages that don't (scanned inserts, image-only pages).
+    Pages with a short text layer ("Q&A") are OCR'd too, but keep their text
+    layer when OCR finds no more than it.
+
+    Pages are yielded in order as soon as they are done. Runs of pages that
+    need OCR are rendered and OCR'd a window at a time, so the first page
+    arrives quickly however long the document is.
+
+    Args:
+        backend: Name of the PDF text backend; defaults to PDF_TEXT_BACKEND.
+        lang: OCR language(s) (see check_ocr_lang). "auto" is detected once,
+            from the first pages that need OCR.
+
+    Yields:
+        dict: {"page": int, "pages": int, "text": str, "ocr": bool}, plus
+        "lang" (the OCR languages used) on pages whose text came from OCR
+    """
+    text_backend = get_pdf_text_backend(backend)
+    lang = lang or OCR_LANG
+    with pdf_on_disk(source) as pdf_path:
+        try:
+            total, page_texts = text_backend.read(pdf_path)
+        except Exception as e:
+            # No readable text layer at all, every page is OCR'd
+            logger.warning("%s could not read the PDF text layer, OCRing every page: %s", text_backend.name, e)
+            page_texts = None
+            total = pdfinfo_from_path(pdf_path, timeout=time_left())["Pages"]
+
+        window = PDF_RENDER_WINDOW if PDF_RENDER_WINDOW > 0 else total
+        pending = []
+        # Short text layers of the pending pages, kept in case OCR does worse
+        layer_texts = {}
+
+        def ocr_pending():
+            nonlocal lang
+            if lang == "auto":
+                lang = detect_pdf_lang(pdf_path, pending)
+            texts = ocr_pdf_pages(pdf_path, pending, lang=lang)
+            done = []
+            for number, text in zip(pending, texts):
+                layer_text = layer_texts.pop(number, "")
+                if len(text.strip()) > len(layer_text.strip()):
+                    record_metric("extracted_pages_total", source="ocr")
+                    done.append({"page": number, "pages": total, "text": text, "ocr": True, "lang": lang})
+                else:
+                    record_metric("extracted_pages_total", source="text_layer")
+                    done.append({"page": number, "pages": total, "text": layer_text, "ocr": False})
+            pending.clear()
+            return done
+
+        for number in range(1, total + 1):
+            text = ""
+            if page_texts is not None:
+                try:
+                    with timed_stage("pdf_text_layer"):
+                        text = next(page_texts, "")
+                except Exception as e:
+                    # The rest of the document goes to OCR
+                    logger.warning("%s failed at page %d, OCRing the rest: %s", text_backend.name, number, e)
+                    page_texts = None
+
+            if len(text.strip()) < PDF_MIN_PAGE_CHARS:
+                pending.append(number)
+                if text.strip():
+                    layer_texts[number] = text
+                if len(pending) >= window:
+                    yield from ocr_pending()
+                continue
+
+            # Earlier pages waiting for OCR go first to keep page order
+            if pending:
+                yield from ocr_pending()
+            record_metric("extracted_pages_total", source="text_layer")
+            yield {"page": number, "pages": total, "text": text, "ocr": False}
+
+        if pending:
+            yield from ocr_pending()
+
+
+def extract_pdf_document(source, backend=None, lang=None):
+    """
+    Extracts a whole PDF with iter_pdf_pages.
+
+    Returns:
+        dict: {"text": str, "ocr_pages": list[int], "ocr_lang": str | None}
+        where ocr_pages are the 1-based numbers of the pages that were OCR'd
+        and ocr_lang the languages they were OCR'd in.
+    """
+    page_texts = []
+    ocr_pages = []
+    ocr_lang = None
+    for page in iter_pdf_pages(source, backend, lang):
+        page_texts.append(page["text"])
+        if page["ocr"]:
+            ocr_pages.append(page["page"])
+            ocr_lang = page["lang"]
+        report_progress(page["page"], page["pages"])
+
+    return {"text": clean_text("\n".join(page_texts)), "ocr_pages": ocr_pages, "ocr_lang": ocr_lang}
+
+
+# ------------------------------
+# Office Open XML packages (.docx / .pptx read without the object model)
+# ------------------------------
+_R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_REL_TYPES = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/"
+
+
+def _part_rels(zipf, part_name):
+    # Returns {rId: (relationship type, part name)} for a part's internal
+    # relationships; part_name "" is the package itself
+    folder, name = posixpath.split(part_name)
+    rels_name = posixpath.join(folder, "_rels", name + ".rels")
+    if rels_name not in zipf.namelist():
+        return {}
+
+    rels = {}
+    for rel in etree.fromstring(zipf.read(rels_name)).iter(f"{_PKG_REL}Relationship"):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target")
+        if target.startswith("/"):
+            target = target.lstrip("/")
+        else:
+            target = posixpath.normpath(posixpath.join(folder, target))
+        rels[rel.get("Id")] = (rel.get("Type"), target)
+    return rels
+
+
+def _main_part(zipf):
+    # word/document.xml, ppt/presentation.xml, ... as named by the package
+    return next(
+        target
+        for rel_type, target in _part_rels(zipf, "").values()
+        if rel_type == _REL_TYPES + "officeDocument"
+    )
+
+
+# Fast path: streams the text parts of a .docx instead of loading it into
+# python-docx. Besides body paragraphs it also reads tables, text boxes,
+# headers, footers, footnotes and endnotes.
+DOCX_FAST_PATH = os.environ.get("DOCX_FAST_PATH", "1") == "1"
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+# Run content and its text equivalent, as in python-docx's Run.text
+_DOCX_RUN_TEXT = {
+    f"{_W}tab": "\t",
+    f"{_W}ptab": "\t",
+    f"{_W}cr": "\n",
+    f"{_W}noBreakHyphen": "-",
+}
+
+# Notes Word adds itself (the line above the notes, etc.) rather than text
+_DOCX_NOTE_TAGS = (f"{_W}footnote", f"{_W}endnote")
+_DOCX_SEPARATOR_NOTES = ("separator", "continuationSeparator", "continuationNotice")
+
+
+def _iter_docx_paragraphs(stream):
+    # Paragraphs can nest (a text box inside a run of another paragraph), so
+    # each open w:p gets its own buffer; an inner paragraph comes out first.
+    buffers = []
+    skipping = 0
+    depth = 0
+    for event, elem in etree.iterparse(stream, events=("start", "end"), resolve_entities=False):
+        tag = elem.tag
+        if event == "start":
+            depth += 1
+            if tag == _MC_FALLBACK:
+                # Same content as the mc:Choice next to it
+                skipping += 1
+            elif tag in _DOCX_NOTE_TAGS and elem.get(f"{_W}type") in _DOCX_SEPARATOR_NOTES:
+                skipping += 1
+            elif tag == f"{_W}p":
+                buffers.append([])
+            continue
+
+        depth -= 1
+        if tag == f"{_W}p":
+            text = "".join(buffers.pop())
+            if not skipping:
+                yield text
+        elif tag == _MC_FALLBACK or (
+            tag in _DOCX_NOTE_TAGS and elem.get(f"{_W}type") in _DOCX_SEPARATOR_NOTES
+        ):
+            skipping -= 1
+        elif buffers and elem.getparent().tag == f"{_W}r":
+            if tag == f"{_W}t":
+                buffers[-1].append(elem.text or "")
+            elif tag == f"{_W}br":
+                # Page and column breaks have no text equivalent
+                if elem.get(f"{_W}type", "textWrapping") == "textWrapping":
+                    buffers[-1].append("\n")
+            elif tag in _DOCX_RUN_TEXT:
+                buffers[-1].append(_DOCX_RUN_TEXT[tag])
+
+        if depth == 2:
+            # Done with a top-level block (a body paragraph or table); free it
+            # and its predecessors to keep memory flat
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
+def extract_docx_text_fast(source):
+    with zipfile.ZipFile(path_or_stream(source)) as zipf:
+        document = _main_part(zipf)
+        related = sorted(_part_rels(zipf, document).values(), key=lambda rel: rel[1])
+
+        def parts_of(*kinds):
+            return [target for rel_type, target in related if rel_type in [_REL_TYPES + k for k in kinds]]
+
+        # Body first, then headers, footers and notes, each as its own block
+        sections = []
+        for parts in ([document], parts_of("header"), parts_of("footer"), parts_of("footnotes", "endnotes")):
+            seen = set()
+            for part in parts:
+                with zipf.open(part) as stream:
+                    text = "\n".join(_iter_docx_paragraphs(stream)).strip()
+                # First-page and even-page headers often repeat the default one
+                if text and text not in seen:
+                    seen.add(text)
+                    sections.append(text)
+
+    return clean_text("\n\n".join(sections))
+
+
+def extract_docx_text(source):
+    if DOCX_FAST_PATH:
+        try:
+            return extract_docx_text_fast(source)
+        except Exception as e:
+            logger.warning("⚠️ Fast .docx extraction failed, using python-docx: %s", e)
+
+    try:
+        doc = Document(path_or_stream(source))
+        full_text = [p.text for p in doc.paragraphs]
+        return clean_text("\n".join(full_text))
+    except Exception as e:
+        raise ValueError(f"Error reading DOCX: {e}")
+
+
+def extract_text_file(source):
+    file_bytes = read_source(source)
+    try:
+        return clean_text(file_bytes.decode("utf-8"))
+    except:
+        return clean_text(file_bytes.decode("latin-1"))
+
+
+def extract_text_from_any(source, filename: str, lang=None):
+    filename = filename.lower()
+
+    # ----- PDF -----
+    if filename.endswith(".pdf"):
+        return extract_pdf_document(source, lang=lang)["text"]
+
+    # ----- Images -----
+    if filename.endswith((".jpg", ".jpeg", ".png", ".tiff")):
+        with Image.open(path_or_stream(source)) as img:
+            return clean_text(ocr_image(img, lang))
+
+    # ----- DOCX -----
+    if filename.endswith(".docx"):
+        return extract_docx_text(source)
+
+    # ----- TXT -----
+    if filename.endswith(".txt"):
+        return extract_text_file(source)
+
+    raise ValueError("Unsupported file type for extraction.")
+
+
+# ------------------------------
+# Python .pptx extraction
+# ------------------------------
+def extract_from_shape(shape, collected, pictures=None):
+    # pictures, if given, collects (key, load) pairs for the embedded images
+    if pictures is not None and shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
+        try:
+            image = shape.image
+        except ValueError:
+            image = None  # linked, not embedded
+        if image is not None:
+            pictures.append((("sha1", image.sha1), lambda image=image: image.blob))
+
+    if shape.has_text_frame:
+        for paragraph in shape.text_frame.paragraphs:
+            collected.append(paragraph.text)
+
+    if shape.has_table:
+        table = shape.table
+        for row in table.rows:
+            for cell in row.cells:
+                for paragraph in cell.text_frame.paragraphs:
+                    collected.append(paragraph.text)
+
+    if shape.shape_type == 6:  # GROUPED SHAPE
+        for subshape in shape.shapes:
+            extract_from_shape(subshape, collected, pictures)
+
+
+# Fast path: reads slide XML straight from the zip instead of building the
+# python-pptx object model, yielding the same text in the same order.
+PPTX_FAST_PATH = os.environ.get("PPTX_FAST_PATH", "1") == "1"
+
+_P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+
+# Ancestors of an a:p that python-pptx reads: a shape's own text body, or a
+# table cell (a:p's inside anything else, e.g. charts or SmartArt, are not text)
+_SHAPE_TEXT_PATH = (f"{_P}sp", f"{_P}txBody")
+_TABLE_TEXT_PATH = (
+    f"{_P}graphicFrame", f"{_A}graphic", f"{_A}graphicData",
+    f"{_A}tbl", f"{_A}tr", f"{_A}tc", f"{_A}txBody",
+)
+_PICTURE_PATH = (f"{_P}pic", f"{_P}blipFill")
+_SLIDE_ROOT_PATH = (f"{_P}sld", f"{_P}cSld", f"{_P}spTree")
+
+
+def _pptx_slide_parts(zipf):
+    # Slide order comes from presentation.xml's sldIdLst, not from part names
+    presentation = _main_part(zipf)
+    rels = _part_rels(zipf, presentation)
+    root = etree.fromstring(zipf.read(presentation))
+    return [rels[sld_id.get(f"{_R}id")][1] for sld_id in root.iter(f"{_P}sldId")]
+
+
+def _shape_path(path):
+    # path holds the ancestors of an element, outermost first. Returns them
+    # from the (possibly grouped) shape down, or None outside the shape tree.
+    if tuple(path[:3]) != _SLIDE_ROOT_PATH:
+        return None
+    i = 3
+    while i < len(path) and path[i] == f"{_P}grpSp":
+        i += 1
+    return tuple(path[i:])
+
+
+def _paragraph_text(p):
+    # Same as python-pptx's _Paragraph.text: runs and fields, a:br as "\v"
+    parts = []
+    for child in p:
+        if child.tag == f"{_A}r" or child.tag == f"{_A}fld":
+            t = child.find(f"{_A}t")
+            if t is not None and t.text:
+                parts.append(t.text)
+        elif child.tag == f"{_A}br":
+            parts.append("\v")
+    return "".join(parts)
+
+
+def _iter_slide_content(stream):
+    # Yields ("text", paragraph text) and ("picture", relationship id)
+    path = []
+    for event, elem in etree.iterparse(stream, events=("start", "end"), resolve_entities=False):
+        if event == "start":
+            path.append(elem.tag)
+            continue
+
+        path.pop()
+        if elem.tag == f"{_A}p" and _shape_path(path) in (_SHAPE_TEXT_PATH, _TABLE_TEXT_PATH):
+            yield "text", _paragraph_text(elem)
+        elif elem.tag == f"{_A}blip" and _shape_path(path) == _PICTURE_PATH:
+            if elem.get(f"{_R}embed"):
+                yield "picture", elem.get(f"{_R}embed")
+        elif len(path) == 3 and tuple(path) == _SLIDE_ROOT_PATH:
+            # Done with a top-level shape; free it and its predecessors
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
+def iter_pptx_slides_fast(source, pictures=False, skip=()):
+    with zipfile.ZipFile(path_or_stream(source)) as zipf:
+        for slide_index, part_name in enumerate(_pptx_slide_parts(zipf)):
+            if slide_index + 1 in skip:
+                continue
+            slide_text = []
+            slide_pictures = []
+            with zipf.open(part_name) as stream:
+                for kind, value in _iter_slide_content(stream):
+                    if kind == "text":
+                        slide_text.append(value)
+                    elif pictures:
+                        slide_pictures.append(value)
+
+            combined = "\n".join(filter(None, slide_text))
+            slide = {"slide": slide_index + 1, "text": combined}
+            if pictures:
+                rels = _part_rels(zipf, part_name)
+                slide["pictures"] = [
+                    (("part", rels[rel_id][1]), lambda target=rels[rel_id][1]: zipf.read(target))
+                    for rel_id in slide_pictures
+                    if rel_id in rels
+                ]
+            yield slide
+
+
+def _iter_pptx_slides(source, pictures, skip):
+    done = 0
+    if PPTX_FAST_PATH:
+        try:
+            for slide in iter_pptx_slides_fast(source, pictures, skip):
+                yield slide
+                done = slide["slide"]
+            return
+        except Exception as e:
+            # Anything the fast path can't read goes through python-pptx,
+            # picking up after the slides already produced
+            logger.warning("⚠️ Fast .pptx extraction failed, using python-pptx: %s", e)
+
+    prs = Presentation(path_or_stream(source))
+
+    for slide_index, slide in enumerate(prs.slides):
+        if slide_index < done or slide_index + 1 in skip:
+            continue
+        slide_text = []
+        slide_pictures = [] if pictures else None
+        for shape in slide.shapes:
+            extract_from_shape(shape, slide_text, slide_pictures)
+
+        combined = "\n".join(filter(None, slide_text))
+        slide = {"slide": slide_index + 1, "text": combined}
+        if pictures:
+            slide["pictures"] = slide_pictures
+        yield slide
+
+
+def _open_picture(blob):
+    # The picture ready for OCR, or None if Pillow can't decode it
+    try:
+        image = Image.open(BytesIO(blob))
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        # Vector formats (EMF/WMF) and anything else Pillow can't decode
+        logger.info("Skipping a picture Pillow can't read: %s", e)
+        return None
+
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        # Transparent screenshots would otherwise come out on black
+        background = Image.new("RGBA", image.size, "white")
+        with image:
+            image = Image.alpha_composite(background, image.convert("RGBA"))
+    return image
+
+
+def ocr_picture(blob, lang=None):
+    image = _open_picture(blob)
+    if image is None:
+        return ""
+    with image:
+        return clean_text(ocr_image(image, lang))
+
+
+def _detect_deck_lang(slides):
+    # Looks ahead for the first few distinct pictures of the deck to detect
+    # its language from; returns the slides (none consumed) and the language.
+    buffered = []
+    blobs = {}
+    for slide in slides:
+        buffered.append(slide)
+        # Loaders may not outlive the slide iterator, so read what's buffered now
+        for key, load in slide["pictures"]:
+            if key not in blobs:
+                blobs[key] = load()
+        slide["pictures"] = [(key, lambda blob=blobs[key]: blob) for key, _load in slide["pictures"]]
+        if len(blobs) >= OCR_DETECT_SAMPLES:
+            break
+
+    images = [
+        image for image in map(_open_picture, list(blobs.values())[:OCR_DETECT_SAMPLES]) if image is not None
+    ]
+    try:
+        lang = detect_ocr_lang(images)
+    finally:
+        for image in images:
+            image.close()
+    return itertools.chain(buffered, slides), lang
+
+
+def _merge_picture_text(slide, futures):
+    texts = []
+    for future in futures:
+        text = future.result()
+        if text and text not in texts:
+            texts.append(text)
+    slide["text"] = "\n".join(filter(None, [slide["text"], *texts]))
+    return slide
+
+
+def _with_picture_text(slides, lang=None):
+    # OCRs each distinct picture of the deck once, however many slides it is
+    # on (logos, template art), and adds its text to every slide showing it.
+    # OCR for the next few slides keeps running while earlier slides are sent.
+    if (lang or OCR_LANG) == "auto":
+        slides, lang = _detect_deck_lang(slides)
+    executor = get_ocr_executor()
+    by_key = {}
+    by_digest = {}
+    pending = deque()
+    for slide in slides:
+        futures = []
+        for key, load in slide.pop("pictures"):
+            if key not in by_key:
+                blob = load()
+                digest = hashlib.sha256(blob).hexdigest()
+                if digest not in by_digest:
+                    by_digest[digest] = executor.submit(ocr_picture, blob, lang)
+                by_key[key] = by_digest[digest]
+            futures.append(by_key[key])
+        pending.append((slide, futures))
+
+        while pending and (len(pending) > OCR_THREADS or all(f.done() for f in pending[0][1])):
+            yield _merge_picture_text(*pending.popleft())
+
+    while pending:
+        yield _merge_picture_text(*pending.popleft())
+
+
+def iter_pptx_slides(source, ocr_images=False, skip=(), lang=None):
+    """
+    Yields {"slide": int, "text": str} for each slide of a .pptx, except the
+    1-based slide numbers in skip. With ocr_images, the text of embedded
+    pictures is OCR'd (in lang, see check_ocr_lang) and added to the text
+    of the slides they are on.
+    """
+    slides = _iter_pptx_slides(source, ocr_images, skip)
+    if ocr_images:
+        slides = _with_picture_text(slides, lang)
+    for slide in slides:
+        record_metric("extracted_slides_total", format="pptx")
+        yield slide
+
+
+def extract_text_from_pptx_file(source, ocr_images=False, known=None, lang=None):
+    """
+    Extracts every slide of a .pptx.
+
+    Args:
+        known: Optional {slide number: text} of slides whose results are
+            already known (unchanged since an earlier version of the deck);
+            only the other slides are extracted.
+    """
+    if not known:
+        return list(iter_pptx_slides(source, ocr_images, lang=lang))
+
+    slides = {slide["slide"]: slide for slide in iter_pptx_slides(source, ocr_images, known, lang)}
+    slides.update((number, {"slide": number, "text": text}) for number, text in known.items())
+    return [slides[number] for number in sorted(slides)]
+
+
+def pptx_slide_fingerprints(source):
+    """
+    Returns a fingerprint for each slide, in order: a hash of the slide's XML
+    and of the images it uses (by zip CRC and size, so media isn't read).
+    Slides with the same fingerprint give the same text.
+    """
+    fingerprints = []
+    with zipfile.ZipFile(path_or_stream(source)) as zipf:
+        for part_name in _pptx_slide_parts(zipf):
+            digest = hashlib.sha256(zipf.read(part_name))
+            images = sorted(
+                (info.CRC, info.file_size)
+                for rel_type, target in _part_rels(zipf, part_name).values()
+                if rel_type == _REL_TYPES + "image"
+                for info in [zipf.getinfo(target)]
+            )
+            digest.update(json.dumps(images).encode("ascii"))
+            fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+def diff_slide_fingerprints(old, new):
+    """
+    Compares the slide fingerprints of two versions of a deck. Slides moved by
+    insertions or deletions still count as unchanged.
+
+    Returns:
+        dict: {"changed", "added", "unchanged"} as slide numbers in the new
+        version and {"removed"} as slide numbers in the old one.
+    """
+    diff = {"changed": [], "added": [], "removed": [], "unchanged": []}
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for op, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        old_numbers = list(range(old_start + 1, old_end + 1))
+        new_numbers = list(range(new_start + 1, new_end + 1))
+        if op == "equal":
+            diff["unchanged"].extend(new_numbers)
+            continue
+        # A replaced run pairs up as changed slides; any surplus was added or removed
+        paired = min(len(old_numbers), len(new_numbers))
+        diff["changed"].extend(new_numbers[:paired])
+        diff["added"].extend(new_numbers[paired:])
+        diff["removed"].extend(old_numbers[paired:])
+    return diff
+
+
+# ------------------------------
+# Java .ppt extraction
+# ------------------------------
+PPT_JAR_PATH = os.path.join(os.path.dirname(__file__), "ppt_converter/target/ppt-converter-1.0-jar-with-dependencies.jar")
+# Number of warm JVMs kept for .ppt extraction
+PPT_JVM_WORKERS = int(os.environ.get("PPT_JVM_WORKERS", "2"))
+# A job running longer than this kills its JVM (which is then restarted)
+PPT_JVM_TIMEOUT = float(os.environ.get("PPT_JVM_TIMEOUT", "120"))
+# Idle workers are pinged before reuse once they've been idle this long
+PPT_JVM_PING_INTERVAL = float(os.environ.get("PPT_JVM_PING_INTERVAL", "30"))
+
+
+class JvmWorkerCrashed(Exception):
+    pass
+
+
+class JvmWorkerTimeout(JvmWorkerCrashed):
+    pass
+
+
+class JvmWorker:
+    """
+    One long-lived `PptTextExtractor --server` process.
+
+    Jobs and replies are framed as 1 byte type + 4 byte big-endian length +
+    payload over the process's stdin/stdout.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.last_used = 0.0
+
+    def start(self):
+        self.process = subprocess.Popen(
+            ["java", "-jar", PPT_JAR_PATH, "--server"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.last_used = time.monotonic()
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _read_exact(self, size):
+        data = self.process.stdout.read(size)
+        if data is None or len(data) < size:
+            raise JvmWorkerCrashed("Java extractor exited unexpectedly.")
+        return data
+
+    def frames(self, op, payload=b"", timeout=PPT_JVM_TIMEOUT):
+        """
+        Sends one job and yields its (type, payload) reply frames as they
+        arrive, up to and including the terminal one (anything but a slide).
+        """
+        # Killing the JVM on timeout closes its stdout, which unblocks the read
+        timed_out = threading.Event()
+        process = self.process
+
+        def kill():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            try:
+                process.stdin.write(struct.pack(">cI", op, len(payload)) + payload)
+                process.stdin.flush()
+                while True:
+                    kind, length = struct.unpack(">cI", self._read_exact(5))
+                    yield kind, self._read_exact(length)
+                    if kind != b"S":
+                        return
+            except (BrokenPipeError, ValueError):
+                raise JvmWorkerCrashed("Java extractor exited unexpectedly.")
+        except JvmWorkerCrashed:
+            if timed_out.is_set():
+                raise JvmWorkerTimeout(f"Java extractor took longer than {timeout:g} seconds.")
+            raise
+        finally:
+            timer.cancel()
+            self.last_used = time.monotonic()
+
+    def ping(self):
+        try:
+            return [kind for kind, _ in self.frames(b"P", timeout=5)] == [b"P"]
+        except JvmWorkerCrashed:
+            return False
+
+    def quit(self):
+        try:
+            self.process.stdin.write(struct.pack(">cI", b"Q", 0))
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            pass
+        self.stop()
+
+
+class JvmWorkerPool:
+    """
+    Keeps up to `size` warm JVMs and hands them out one job at a time.
+
+    Workers are started lazily, health-checked before reuse when they've been
+    idle, and restarted when they crash or time out.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle.empty() and len(self._workers) < self.size:
+                worker = JvmWorker()
+                self._workers.append(worker)
+                return worker
+        return self._idle.get()
+
+    def _release(self, worker):
+        self._idle.put(worker)
+
+    def _ensure_healthy(self, worker):
+        if not worker.is_alive():
+            worker.restart()
+        elif time.monotonic() - worker.last_used > PPT_JVM_PING_INTERVAL and not worker.ping():
+            worker.restart()
+
+    def stream(self, op, payload):
+        """
+        Runs one job on a warm worker and yields its reply frames.
+
+        A worker that crashes before replying is restarted and the job retried
+        once; a document that crashes a fresh JVM as well is reported as a
+        failure. A worker left mid-reply (crash, timeout, or the caller
+        stopped iterating) is stopped and restarted on its next use.
+        """
+        worker = self._acquire()
+        finished = False
+        try:
+            self._ensure_healthy(worker)
+            for attempt in (1, 2):
+                replied = False
+                try:
+                    for frame in worker.frames(op, payload):
+                        replied = True
+                        yield frame
+                    finished = True
+                    return
+                except JvmWorkerTimeout:
+                    raise
+                except JvmWorkerCrashed:
+                    if replied or attempt == 2:
+                        raise
+                    worker.restart()
+        finally:
+            if not finished:
+                worker.stop()
+            self._release(worker)
+
+    def health(self):
+        with self._lock:
+            workers = list(self._workers)
+        return {
+            "size": self.size,
+            "started": len(workers),
+            "alive": sum(1 for w in workers if w.is_alive()),
+        }
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            if worker.is_alive():
+                worker.quit()
+            worker.stop()
+
+
+ppt_workers = JvmWorkerPool(PPT_JVM_WORKERS)
+register_metric(Observed("ppt_jvm_workers_alive", "Warm .ppt JVM workers.", lambda: ppt_workers.health()["alive"]))
+
+
+@app.on_event("shutdown")
+def shutdown_ppt_workers():
+    ppt_workers.shutdown()
+
+
+class PptExtractionError(Exception):
+    pass
+
+
+def ppt_slide_text(blocks):
+    lines = []
+    for block in blocks:
+        if block["type"] == "table":
+            lines.extend(cell for row in block["rows"] for cell in row if cell)
+        else:
+            lines.append(block["text"])
+    return "\n".join(lines)
+
+
+def iter_ppt_slides(source):
+    """
+    Extracts a .ppt given as bytes (piped straight to the JVM) or as a file
+    path (read by the JVM itself), yielding each slide as soon as the JVM
+    produces it.
+
+    Yields:
+        dict: {"slide": int, "text": str, "blocks": list} where blocks keep
+        the boundaries of each text shape and table on the slide.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        op, payload = b"X", bytes(source)
+    else:
+        op, payload = b"F", os.fspath(source).encode("utf-8")
+
+    for kind, data in timed_iter("jvm_call", ppt_workers.stream(op, payload)):
+        if kind == b"S":
+            slide = json.loads(data)
+            record_metric("extracted_slides_total", format="ppt")
+            yield {"slide": slide["slide"], "text": ppt_slide_text(slide["blocks"]), "blocks": slide["blocks"]}
+        elif kind == b"E":
+            raise PptExtractionError(data.decode("utf-8", "replace"))
+
+
+def extract_text_from_ppt_file(source):
+    try:
+        return list(iter_ppt_slides(source))
+    except (PptExtractionError, JvmWorkerCrashed, OSError) as e:
+        logger.error("❌ Java extraction failed: %s", e)
+        return []
+
+
+# ----------------------------
+# Helper to create zip in memory
+# ----------------------------
+def create_exam_package_in_memory(document_name, questions, answers):
+    """
+    Creates questions and answers Word docs in memory and zips them.
+
+    Returns:
+        BytesIO: The zip file as a BytesIO object.
+    """
+    # In-memory Word docs
+    questions_io = BytesIO()
+    answers_io = BytesIO()
+
+    # ------------------
+    # Questions doc
+    # ------------------
+    with timed_stage("docx_build"):
+        doc_q = Document()
+        doc_q.add_heading(f"{document_name} - Questions", level=1)
+        for q in questions:  # ✅ Removed enumerate
+            if q.strip():  # Only add non-empty lines
+                para = doc_q.add_paragraph(q)  # ✅ No numbering added here
+                para.paragraph_format.space_after = Pt(6)
+        doc_q.save(questions_io)
+        questions_io.seek(0)  # reset pointer
+
+    # ------------------
+    # Answers doc
+    # ------------------
+    with timed_stage("docx_build"):
+        doc_a = Document()
+        doc_a.add_heading(f"{document_name} - Answers", level=1)
+        for a in answers:  # ✅ Removed enumerate
+            if a.strip():  # Only add non-empty lines
+                para = doc_a.add_paragraph(a)  # ✅ No numbering added here
+                para.paragraph_format.space_after = Pt(6)
+        doc_a.save(answers_io)
+        answers_io.seek(0)
+
+    # ------------------
+    # Create zip in memory
+    # ------------------
+    zip_io = BytesIO()
+    with timed_stage("zip_build"), zipfile.ZipFile(zip_io, mode="w") as zipf:
+        zipf.writestr(f"{document_name}_questions.docx", questions_io.getvalue())
+        zipf.writestr(f"{document_name}_answers.docx", answers_io.getvalue())
+    zip_io.seek(0)
+
+    return zip_io
+
+
+# ----------------------------
+# Faster exam package: template + streamed zip
+# ----------------------------
+EXAM_ITEM_STYLE = "Exam Item"
+EXAM_ZIP_CHUNK_SIZE = 1024 * 1024
+
+_exam_template = None
+_exam_item_prototype = None
+
+
+def exam_template():
+    """
+    Returns the template for exam documents (as .docx bytes) and a prototype
+    question paragraph, both built once per process. Spacing lives in the
+    "Exam Item" paragraph style instead of on every paragraph.
+    """
+    global _exam_template, _exam_item_prototype
+    if _exam_template is None:
+        doc = Document()
+        style = doc.styles.add_style(EXAM_ITEM_STYLE, WD_STYLE_TYPE.PARAGRAPH)
+        style.base_style = doc.styles["Normal"]
+        style.paragraph_format.space_after = Pt(6)
+
+        template_io = BytesIO()
+        doc.save(template_io)
+        _exam_template = template_io.getvalue()
+        _exam_item_prototype = parse_xml(
+            f'<w:p {nsdecls("w")}><w:pPr><w:pStyle w:val="{style.style_id}"/></w:pPr>'
+            f'<w:r><w:t xml:space="preserve"></w:t></w:r></w:p>'
+        )
+    return _exam_template, _exam_item_prototype
+
+
+def build_exam_docx(title, lines):
+    """
+    Builds one exam document (heading plus one paragraph per non-empty line)
+    from the template.
+
+    Returns:
+        bytes: The .docx file.
+    """
+    with timed_stage("docx_build"):
+        template, prototype = exam_template()
+        doc = Document(BytesIO(template))
+        doc.add_heading(title, level=1)
+
+        body = doc.element.body
+        sect_pr = body.sectPr
+        for line in lines:
+            if not line.strip():
+                continue
+            if "\t" in line:
+                # python-docx turns tabs into w:tab elements
+                doc.add_paragraph(line, style=EXAM_ITEM_STYLE)
+                continue
+            # Cloning a ready-made paragraph is much cheaper than add_paragraph
+            paragraph = copy.deepcopy(prototype)
+            paragraph[-1][-1].text = line
+            if sect_pr is not None:
+                sect_pr.addprevious(paragraph)
+            else:
+                body.append(paragraph)
+
+        docx_io = BytesIO()
+        doc.save(docx_io)
+        return docx_io.getvalue()
+
+
+class _ZipStreamSink:
+    # Write-only file object for zipfile; the bytes written so far are
+    # handed out by drain(). zipfile writes data descriptors instead of
+    # seeking back, since this can't seek.
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+class ZipStream:
+    """
+    A zip archive written incrementally: add() and close() yield the bytes
+    of the archive as they are produced, so it can go straight into a
+    response without being built in memory first.
+    """
+
+    def __init__(self):
+        self._sink = _ZipStreamSink()
+        self._zipf = zipfile.ZipFile(self._sink, mode="w")
+
+    def add(self, name, data):
+        view = memoryview(data)
+        with self._zipf.open(name, mode="w") as entry:
+            for start in range(0, len(view), EXAM_ZIP_CHUNK_SIZE):
+                entry.write(view[start:start + EXAM_ZIP_CHUNK_SIZE])
+                yield from self._sink.drain()
+        yield from self._sink.drain()
+
+    def close(self):
+        # Writes the central directory
+        self._zipf.close()
+        yield from self._sink.drain()
+
+
+def iter_zip_stream(files):
+    # Zips (name, bytes) pairs as a stream of chunks
+    archive = ZipStream()
+    for name, data in files:
+        yield from archive.add(name, data)
+    yield from archive.close()
+
+
+# ======================================================
+# EXTRACTION WORKER POOL
+# ======================================================
+# OCR, PDF rasterization and python-pptx parsing are CPU-bound, so they run in
+# a process pool of EXTRACT_WORKERS (set with the OCR settings above) instead
+# of on the event loop.
+EXTRACT_QUEUE_DEPTH = int(os.environ.get("EXTRACT_QUEUE_DEPTH", "16"))
+EXTRACT_JOB_TIMEOUT = float(os.environ.get("EXTRACT_JOB_TIMEOUT", "300"))
+# Workers stop themselves at the timeout (pdftoppm and Tesseract get what is
+# left of it); one still running this many seconds later is killed
+EXTRACT_KILL_GRACE = float(os.environ.get("EXTRACT_KILL_GRACE", "30"))
+
+
+class PoolSaturatedError(Exception):
+    # Seconds clients are told to wait before retrying (Retry-After)
+    retry_after = 1
+
+
+class ExtractionTimeoutError(Exception):
+    pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_pending = 0
+register_metric(Observed("extraction_pool_workers", "Extraction worker processes.", lambda: EXTRACT_WORKERS))
+register_metric(Observed(
+    "extraction_pool_pending", "Extractions running or queued in the worker pool.", lambda: _pool_pending,
+))
+
+# Workers are started by a forkserver, not forked from this process: it
+# already runs the event drain thread, threadpool and JVM timer threads, and
+# forking a threaded process can deadlock the child on locks held at fork time.
+_pool_context = multiprocessing.get_context("forkserver")
+# Imported once in the forkserver, so each worker starts without re-importing
+_pool_context.set_forkserver_preload([__name__])
+
+# Pool workers report progress back to the main process through this queue,
+# created with the pool (workers import this module too, and don't need one)
+_worker_events = None
+_in_pool_worker = False
+_worker_job_id = None
+# time.monotonic() by which the worker's current task must finish, or None
+_worker_deadline = None
+# task id -> pid of the worker running it (None until it starts)
+_running_tasks = {}
+# Set in the main process while a background job is running
+current_job_id = contextvars.ContextVar("current_job_id", default=None)
+# Seconds run_in_pool waits for a result; queued work (jobs, batches) sets
+# its own (JOB_TIMEOUT). 0 waits indefinitely.
+extraction_timeout = contextvars.ContextVar("extraction_timeout", default=EXTRACT_JOB_TIMEOUT)
+
+
+def _init_pool_worker(events):
+    global _worker_events, _in_pool_worker
+    _worker_events = events
+    _in_pool_worker = True
+
+
+def _run_task(task_id, job_id, deadline, func, *args):
+    # Runs in a pool worker. Tells the main process which worker has the task
+    # (to kill it if it overruns), tags progress reports with the job they
+    # belong to and applies the deadline.
+    global _worker_job_id, _worker_deadline
+    _worker_events.put(("started", task_id, os.getpid()))
+    _worker_job_id = job_id
+    _worker_deadline = deadline
+    try:
+        time_left()
+        return func(*args)
+    except ExtractionTimeoutError:
+        raise
+    except Exception as e:
+        # pdftoppm and Tesseract report their timeouts in their own ways
+        if deadline is not None and time.monotonic() >= deadline:
+            raise ExtractionTimeoutError("Extraction ran out of time.") from e
+        raise
+    finally:
+        _worker_job_id = None
+        _worker_deadline = None
+
+
+def time_left():
+    """
+    Seconds left before the deadline of the pool task being run, for the
+    timeouts of subprocesses and Tesseract; None when there is no deadline.
+
+    Raises ExtractionTimeoutError once the deadline has passed.
+    """
+    if _worker_deadline is None:
+        return None
+    left = _worker_deadline - time.monotonic()
+    if left <= 0:
+        raise ExtractionTimeoutError("Extraction ran out of time.")
+    return left
+
+
+def report_progress(done, total):
+    """Records progress for the background job (if any) the caller is running for."""
+    if _in_pool_worker:
+        if _worker_job_id is not None:
+            _worker_events.put(("progress", _worker_job_id, done, total))
+        return
+    job_id = current_job_id.get()
+    if job_id is not None:
+        _handle_worker_event(("progress", job_id, done, total))
+
+
+def _handle_worker_event(event):
+    kind, *payload = event
+    if kind == "progress":
+        update_job_progress(*payload)
+    elif kind == "started":
+        task_id, pid = payload
+        if task_id in _running_tasks:  # gone if already finished
+            _running_tasks[task_id] = pid
+    elif kind == "item":
+        _deliver_stream_item(*payload)
+    elif kind == "end":
+        _deliver_stream_item(payload[0], _STREAM_END)
+    elif kind == "metric":
+        name, value, labels = payload
+        METRICS[name].record(value, labels)
+
+
+def _drain_worker_events():
+    while True:
+        event = _worker_events.get()
+        try:
+            _handle_worker_event(event)
+        except Exception as e:
+            logger.exception("❌ Failed to handle worker event: %s", e)
+
+
+_worker_events_thread = None
+
+
+def get_extraction_pool():
+    global _pool, _worker_events, _worker_events_thread
+    with _pool_lock:
+        if _worker_events_thread is None:
+            _worker_events = _pool_context.Queue()
+            _worker_events_thread = threading.Thread(target=_drain_worker_events, daemon=True)
+            _worker_events_thread.start()
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=_pool_context,
+                initializer=_init_pool_worker,
+                initargs=(_worker_events,),
+            )
+        return _pool
+
+
+def _discard_broken_pool(pool):
+    # A worker killed mid-job (e.g. by the OOM killer) breaks the whole pool;
+    # drop it so the next job starts a fresh one.
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _release_pool_slot(_future):
+    global _pool_pending
+    with _pool_lock:
+        _pool_pending -= 1
+
+
+def submit_to_pool(func, *args, timeout=None):
+    """
+    Submits func(*args) to the extraction process pool.
+
+    A slot is held until the worker actually finishes, so jobs that time out
+    still count against the queue depth until they stop (see kill_overdue_task).
+
+    Args:
+        timeout: Seconds the worker has to finish, or None for no deadline.
+
+    Returns:
+        tuple: (the pool, a concurrent.futures.Future for the result, task id)
+
+    Raises:
+        PoolSaturatedError: all workers are busy and the queue is full.
+    """
+    global _pool_pending
+    with _pool_lock:
+        if _pool_pending >= EXTRACT_WORKERS + EXTRACT_QUEUE_DEPTH:
+            raise PoolSaturatedError("Extraction workers are busy, try again shortly.")
+        _pool_pending += 1
+
+    task_id = uuid.uuid4().hex
+    _running_tasks[task_id] = None
+    deadline = time.monotonic() + timeout if timeout else None
+    func, args = _run_task, (task_id, current_job_id.get(), deadline, func, *args)
+
+    def task_done(future):
+        _running_tasks.pop(task_id, None)
+        _release_pool_slot(future)
+
+    pool = get_extraction_pool()
+    try:
+        future = pool.submit(func, *args)
+    except BrokenProcessPool:
+        _discard_broken_pool(pool)
+        pool = get_extraction_pool()
+        try:
+            future = pool.submit(func, *args)
+        except Exception:
+            task_done(None)
+            raise
+    except Exception:
+        task_done(None)
+        raise
+    future.add_done_callback(task_done)
+    return pool, future, task_id
+
+
+def kill_overdue_task(pool, future, task_id):
+    """
+    Kills the worker running a task that is still going EXTRACT_KILL_GRACE
+    seconds after its timeout (stuck in native code that ignores the
+    deadline), so it can't hold a pool slot forever. This breaks the pool:
+    it is replaced, and the tasks it was running fail like after a crash.
+    """
+    def kill():
+        if future.done():
+            return
+        pid = _running_tasks.get(task_id)
+        if pid is None:
+            # Not started yet; it stops at its deadline as soon as it does
+            future.cancel()
+            return
+        logger.error("❌ Extraction worker %d is still running past its timeout, killing it", pid)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            return
+        _discard_broken_pool(pool)
+
+    asyncio.get_running_loop().call_later(EXTRACT_KILL_GRACE, kill)
+
+
+async def run_in_pool(func, *args, timeout=None):
+    """
+    Runs func(*args) in the extraction process pool.
+
+    Args:
+        timeout: Seconds to wait for the result, 0 for no limit. Defaults to
+            extraction_timeout (EXTRACT_JOB_TIMEOUT, or JOB_TIMEOUT for jobs
+            and batches).
+
+    Raises:
+        PoolSaturatedError: all workers are busy and the queue is full.
+        ExtractionTimeoutError: the job ran longer than the timeout.
+    """
+    if timeout is None:
+        timeout = extraction_timeout.get()
+    pool, future, task_id = submit_to_pool(func, *args, timeout=timeout)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout or None)
+    except asyncio.TimeoutError:
+        kill_overdue_task(pool, future, task_id)
+        raise ExtractionTimeoutError(
+            f"Extraction took longer than {timeout:g} seconds."
+        )
+    except BrokenProcessPool:
+        _discard_broken_pool(pool)
+        raise
+
+
+# ------------------------------
+# Streaming results out of the pool
+# ------------------------------
+_STREAM_END = object()
+# stream id -> (event loop, asyncio.Queue of items)
+_streams = {}
+
+
+def _run_streaming(stream_id, func, *args):
+    # Runs in a pool worker; forwards each item func yields as it is produced
+    try:
+        for item in func(*args):
+            _worker_events.put(("item", stream_id, item))
+    except Exception as e:
+        _worker_events.put(("item", stream_id, {"error": str(e)}))
+    finally:
+        _worker_events.put(("end", stream_id))
+
+
+def _deliver_stream_item(stream_id, item):
+    stream = _streams.get(stream_id)
+    if stream is not None:  # gone if the client disconnected
+        loop, items = stream
+        loop.call_soon_threadsafe(items.put_nowait, item)
+
+
+def stream_from_pool(func, *args):
+    """
+    Starts the generator function func(*args) in the extraction pool and
+    returns an async iterator over the items it yields, delivered through
+    the worker event queue as soon as the worker produces them.
+
+    Raises PoolSaturatedError right away (before anything is streamed) when
+    the pool is full.
+    """
+    stream_id = uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    _streams[stream_id] = (loop, items)
+    try:
+        pool, future, task_id = submit_to_pool(_run_streaming, stream_id, func, *args)
+    except Exception:
+        del _streams[stream_id]
+        raise
+
+    def on_done(done):
+        # A crashed or cancelled job never sends its end event
+        if done.cancelled():
+            error = "Extraction was cancelled."
+        elif done.exception() is not None:
+            if isinstance(done.exception(), BrokenProcessPool):
+                _discard_broken_pool(pool)
+            error = str(done.exception()) or "Extraction worker crashed."
+        else:
+            return
+        _deliver_stream_item(stream_id, {"error": error})
+        _deliver_stream_item(stream_id, _STREAM_END)
+
+    future.add_done_callback(on_done)
+
+    async def iterate():
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(items.get(), EXTRACT_JOB_TIMEOUT)
+                except asyncio.TimeoutError:
+                    kill_overdue_task(pool, future, task_id)
+                    yield {"error": f"No progress for {EXTRACT_JOB_TIMEOUT:g} seconds."}
+                    return
+                if item is _STREAM_END:
+                    return
+                yield item
+        finally:
+            _streams.pop(stream_id, None)
+
+    return iterate()
+
+
+@app.on_event("shutdown")
+def shutdown_extraction_pool():
+    # Waits for the workers to exit: without waiting, one can be left blocked
+    # on the call queue while the executor joins it, and the process hangs
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+
+
+# ======================================================
+# ADMISSION CONTROL
+# ======================================================
+# Extractions are admitted per cost class, each with its own concurrency limit
+# and queue, so a burst of scanned PDFs can't hold every worker while .txt and
+# .docx requests wait behind it:
+#   ocr   - scanned PDFs, images, .pptx with ocr_images
+#   jvm   - .ppt (bounded by the warm JVMs anyway; this bounds the queue)
+#   parse - .pptx, .docx and PDFs with a text layer
+#   text  - everything else (.txt)
+# ADMIT_OCR_CONCURRENCY is set with the OCR settings, since OCR_THREADS
+# depends on it.
+ADMIT_JVM_CONCURRENCY = int(os.environ.get("ADMIT_JVM_CONCURRENCY", PPT_JVM_WORKERS))
+ADMIT_PARSE_CONCURRENCY = int(os.environ.get("ADMIT_PARSE_CONCURRENCY", EXTRACT_WORKERS))
+ADMIT_TEXT_CONCURRENCY = int(os.environ.get("ADMIT_TEXT_CONCURRENCY", EXTRACT_WORKERS))
+# Requests waiting per class; more are rejected with 503 + Retry-After
+ADMIT_QUEUE_DEPTH = int(os.environ.get("ADMIT_QUEUE_DEPTH", "16"))
+# Requests that would wait longer than this many seconds (by the class's
+# estimated backlog) are rejected right away too, rather than left to hit a
+# load balancer timeout; 0 disables the bound
+ADMIT_MAX_WAIT = float(os.environ.get("ADMIT_MAX_WAIT", "30"))
+# PDFs with more bytes per page than this are assumed to be scanned
+ADMIT_SCANNED_PAGE_BYTES = int(os.environ.get("ADMIT_SCANNED_PAGE_BYTES", str(100 * 1024)))
+# Seconds pdfinfo gets to count a PDF's pages before admission
+ADMIT_PDFINFO_TIMEOUT = float(os.environ.get("ADMIT_PDFINFO_TIMEOUT", "10"))
+
+
+class AdmissionRejectedError(PoolSaturatedError):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionClass:
+    """
+    A concurrency limit with a bounded FIFO queue, for one cost class.
+
+    Costs are estimated up front (pages for PDFs, MB otherwise); the observed
+    seconds per unit of cost turn the running and queued costs into an
+    estimated wait, which bounds queueing (ADMIT_MAX_WAIT) and is the
+    Retry-After of rejected requests. Only used from the event loop.
+    """
+
+    def __init__(self, name, limit, queue_depth, seconds_per_cost):
+        self.name = name
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self.seconds_per_cost = seconds_per_cost
+        self.running = 0
+        self.running_cost = 0
+        self.queued_cost = 0
+        self._waiters = deque()
+
+    def estimated_wait(self):
+        # Roughly how many seconds until the running and queued work is done
+        return self.seconds_per_cost * (self.queued_cost + self.running_cost) / self.limit
+
+    def retry_after(self):
+        return max(1, math.ceil(self.estimated_wait()))
+
+    async def acquire(self, cost):
+        if self.running < self.limit and not self._waiters:
+            self.running += 1
+            self.running_cost += cost
+            return
+        if len(self._waiters) >= self.queue_depth or (ADMIT_MAX_WAIT and self.estimated_wait() > ADMIT_MAX_WAIT):
+            record_metric("admission_rejected_total", cost_class=self.name)
+            raise AdmissionRejectedError(
+                f"Too many {self.name} extractions in progress, try again shortly.", self.retry_after(),
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued_cost += cost
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._hand_off()  # the slot was already ours
+            else:
+                self._waiters.remove(waiter)
+            raise
+        finally:
+            self.queued_cost -= cost
+        self.running_cost += cost
+
+    def release(self, cost, seconds):
+        # Moving average, so Retry-After follows the current mix of documents
+        self.seconds_per_cost = 0.8 * self.seconds_per_cost + 0.2 * seconds / max(cost, 1)
+        self.running_cost -= cost
+        self._hand_off()
+
+    def _hand_off(self):
+        # The running slot passes straight to the next waiter, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.running -= 1
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "running": self.running,
+            "queued": len(self._waiters),
+            "retry_after": self.retry_after(),
+        }
+
+
+admission_classes = {
+    "ocr": AdmissionClass("ocr", ADMIT_OCR_CONCURRENCY, ADMIT_QUEUE_DEPTH, 2.0),
+    "jvm": AdmissionClass("jvm", ADMIT_JVM_CONCURRENCY, ADMIT_QUEUE_DEPTH, 1.0),
+    "parse": AdmissionClass("parse", ADMIT_PARSE_CONCURRENCY, ADMIT_QUEUE_DEPTH, 0.1),
+    "text": AdmissionClass("text", ADMIT_TEXT_CONCURRENCY, ADMIT_QUEUE_DEPTH, 0.05),
+}
+register_metric(Observed(
+    "admission_running", "Extractions running, by cost class.",
+    lambda: {name: c.running for name, c in admission_classes.items()}, labelname="cost_class",
+))
+register_metric(Observed(
+    "admission_queued", "Extractions waiting to be admitted, by cost class.",
+    lambda: {name: len(c._waiters) for name, c in admission_classes.items()}, labelname="cost_class",
+))
+register_metric(Counter(
+    "admission_rejected_total", "Extractions rejected with 503, by cost class.", ("cost_class",),
+))
+
+
+def _pdf_page_count(pdf_path):
+    # poppler's pdfinfo runs in its own process, so damaged PDFs (and their
+    # xref rebuilds) don't tie up the API process before admission
+    return pdfinfo_from_path(pdf_path, timeout=ADMIT_PDFINFO_TIMEOUT)["Pages"]
+
+
+async def estimate_cost(upload, ocr_images=False):
+    """
+    Returns (cost class, cost) for an upload, from its format and its page
+    count (PDFs) or size in MB (everything else).
+    """
+    ext = os.path.splitext(upload.filename)[1].lower()
+    size_cost = max(1, math.ceil(upload.size / (1024 * 1024)))
+
+    if ext == ".pdf":
+        try:
+            pages = await run_in_threadpool(_pdf_page_count, upload.path)
+        except Exception:
+            # Extraction will most likely fail fast; don't let it queue behind OCR
+            return "parse", size_cost
+        scanned = upload.size / max(pages, 1) >= ADMIT_SCANNED_PAGE_BYTES
+        return ("ocr" if scanned else "parse"), max(pages, 1)
+    if ext in (".jpg", ".jpeg", ".png", ".tiff"):
+        return "ocr", 1
+    if ext == ".ppt":
+        return "jvm", size_cost
+    if ext == ".pptx":
+        return ("ocr" if ocr_images else "parse"), size_cost
+    if ext == ".docx":
+        return "parse", size_cost
+    return "text", 1
+
+
+class AdmissionTicket:
+    def __init__(self, admission_class, cost):
+        self.admission_class = admission_class
+        self.cost = cost
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        # Call from the event loop
+        if not self._released:
+            self._released = True
+            self.admission_class.release(self.cost, time.monotonic() - self.started)
+
+
+async def admit(upload, ocr_images=False):
+    """
+    Waits for the upload's cost class to have room and returns a ticket to
+    release() once the extraction is over.
+
+    Raises:
+        AdmissionRejectedError: the class's queue is full.
+    """
+    name, cost = await estimate_cost(upload, ocr_images)
+    admission_class = admission_classes[name]
+    await admission_class.acquire(cost)
+    return AdmissionTicket(admission_class, cost)
+
+
+@contextlib.asynccontextmanager
+async def admitted(upload, ocr_images=False):
+    ticket = await admit(upload, ocr_images)
+    try:
+        yield ticket
+    finally:
+        ticket.release()
+
+
+# ======================================================
+# RESULT CACHE
+# ======================================================
+# Bump when extractor output changes so stale cached results are not served
+EXTRACTOR_VERSION = "3"
+# "memory", "sqlite" or "none"
+EXTRACT_CACHE_BACKEND = os.environ.get("EXTRACT_CACHE_BACKEND", "memory")
+EXTRACT_CACHE_MAX_BYTES = int(os.environ.get("EXTRACT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+EXTRACT_CACHE_PATH = os.environ.get(
+    "EXTRACT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "slide-extractor-cache.sqlite3")
+)
+
+
+class MemoryCacheBackend:
+    """In-process LRU that evicts the least recently used entries past max_bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def set_many(self, items):
+        for key, value in items:
+            self.set(key, value)
+
+
+class SQLiteCacheBackend:
+    """On-disk store that survives restarts, evicting by last access past max_bytes."""
+
+    def __init__(self, path, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self._db.commit()
+        # Running total of the stored sizes, so writes don't sum the table
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        # One transaction (and one commit) for all of them
+        now = time.time()
+        with self._lock:
+            for key, value in items:
+                if len(value) > self.max_bytes:
+                    continue
+                old = self._db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, len(value), now),
+                )
+                self._size += len(value) - (old[0] if old else 0)
+            while self._size > self.max_bytes:
+                oldest = self._db.execute(
+                    "SELECT key, size FROM results ORDER BY accessed LIMIT 1"
+                ).fetchone()
+                self._db.execute("DELETE FROM results WHERE key = ?", (oldest[0],))
+                self._size -= oldest[1]
+            self._db.commit()
+
+
+class ResultCache:
+    """
+    Caches extraction results keyed by the sha256 of the uploaded bytes plus the
+    extractor kind, EXTRACTOR_VERSION and the options that affect output.
+    Values are stored JSON-encoded in a pluggable backend.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(kind, digest, options):
+        return f"{kind}:{EXTRACTOR_VERSION}:{json.dumps(options, sort_keys=True)}:{digest}"
+
+    def get(self, key):
+        if self.backend is None:
+            return None
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, result):
+        if self.backend is not None:
+            self.backend.set(key, json.dumps(result).encode("utf-8"))
+
+    def set_many(self, results):
+        # (key, result) pairs, written together
+        if self.backend is not None:
+            self.backend.set_many([(key, json.dumps(result).encode("utf-8")) for key, result in results])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": EXTRACT_CACHE_BACKEND,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_cache_backend(name):
+    if name == "memory":
+        return MemoryCacheBackend(EXTRACT_CACHE_MAX_BYTES)
+    if name == "sqlite":
+        return SQLiteCacheBackend(EXTRACT_CACHE_PATH, EXTRACT_CACHE_MAX_BYTES)
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown EXTRACT_CACHE_BACKEND: {name}")
+
+
+extraction_cache = ResultCache(create_cache_backend(EXTRACT_CACHE_BACKEND))
+register_metric(Observed(
+    "extraction_cache_hits_total", "Result cache hits.", lambda: extraction_cache.hits, type="counter",
+))
+register_metric(Observed(
+    "extraction_cache_misses_total", "Result cache misses.", lambda: extraction_cache.misses, type="counter",
+))
+register_metric(Observed(
+    "extraction_cache_hit_ratio", "Share of lookups served from the result cache.",
+    lambda: extraction_cache.stats()["hit_rate"],
+))
+
+
+# ======================================================
+# UPLOAD SPOOLING
+# ======================================================
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Where uploads are spooled; defaults to the system temp dir
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR") or None
+
+
+class UploadTooLargeError(HTTPException):
+    # An HTTPException so that, raised while FastAPI parses the form, it isn't
+    # turned into a generic 400
+    def __init__(self, message):
+        super().__init__(status_code=413, detail=message)
+
+    def __str__(self):
+        return self.detail
+
+
+class SpooledUpload:
+    """
+    An upload written chunk by chunk into its own temp file, so extractors
+    can open it by path instead of holding it in memory. The sha256 used
+    as the cache key is computed while writing.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.size = 0
+        self.sha256 = None
+        fd, self.path = tempfile.mkstemp(
+            dir=UPLOAD_SPOOL_DIR, suffix=os.path.splitext(filename)[1].lower()
+        )
+        self._file = os.fdopen(fd, "w+b")
+        self._hash = hashlib.sha256()
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > MAX_UPLOAD_BYTES:
+            raise UploadTooLargeError(
+                f"{self.filename} is larger than the {MAX_UPLOAD_BYTES} byte upload limit."
+            )
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def finish(self):
+        self._file.close()
+        self.sha256 = self._hash.hexdigest()
+        return self
+
+    def copy_from(self, stream):
+        try:
+            while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+                self.write(chunk)
+            return self.finish()
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# ------------------------------
+# Streaming multipart uploads
+# ------------------------------
+# Starlette spools every uploaded file to a temp file of its own before the
+# endpoint runs, and the size cap could only be checked afterwards. Routes
+# here parse multipart bodies with SpoolingMultiPartParser instead, which
+# writes each file straight into a SpooledUpload as it arrives (once, hashed
+# on the way) and rejects oversized bodies mid-stream.
+class _UploadSpool:
+    """The file behind an UploadFile parsed by SpoolingMultiPartParser."""
+
+    def __init__(self, upload):
+        self.upload = upload
+        # Set once spool_upload hands the upload to its new owner
+        self.claimed = False
+
+    def write(self, data):
+        self.upload.write(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.upload._file.seek(offset, whence)
+
+    def read(self, size=-1):
+        return self.upload._file.read(size)
+
+    def close(self):
+        # Starlette closes the form after the response; unclaimed uploads go with it
+        if not self.claimed:
+            self.upload.close()
+
+
+class SpoolingMultiPartParser(MultiPartParser):
+    # Hooks into Starlette's parser internals (_current_part,
+    # _files_to_close_on_error), hence the Starlette range in requirements.txt
+
+    def __init__(self, headers, stream, *, limit, **kwargs):
+        super().__init__(headers, self._capped(stream, limit), **kwargs)
+        self._spools = []
+
+    async def parse(self):
+        try:
+            return await super().parse()
+        except BaseException:
+            # Older Starlettes only close the files on MultiPartException
+            for spool in self._spools:
+                spool.close()
+            raise
+
+    @staticmethod
+    async def _capped(stream, limit):
+        received = 0
+        async for chunk in stream:
+            received += len(chunk)
+            if received > limit:
+                raise UploadTooLargeError(f"Request body is larger than the {limit} byte limit.")
+            yield chunk
+
+    def on_headers_finished(self):
+        super().on_headers_finished()
+        part = self._current_part
+        if part.file is not None:
+            # Swap Starlette's SpooledTemporaryFile for our own spool file
+            self._files_to_close_on_error.pop().close()
+            spool = _UploadSpool(SpooledUpload(part.file.filename or ""))
+            self._files_to_close_on_error.append(spool)
+            self._spools.append(spool)
+            part.file.file = spool
+
+
+class SpoolingRequest(Request):
+    async def _get_form(self, *, max_files=1000, max_fields=1000, max_part_size=1024 * 1024):
+        content_type = self.headers.get("Content-Type", "")
+        if self._form is None and content_type.lower().startswith("multipart/form-data"):
+            try:
+                async with contextlib.aclosing(self.stream()) as stream:
+                    parser = SpoolingMultiPartParser(
+                        self.headers,
+                        stream,
+                        limit=request_body_limit(self.url.path),
+                        max_files=max_files,
+                        max_fields=max_fields,
+                        max_part_size=max_part_size,
+                    )
+                    self._form = await parser.parse()
+            except MultiPartException as exc:
+                raise HTTPException(status_code=400, detail=exc.message)
+        return await super()._get_form(max_files=max_files, max_fields=max_fields, max_part_size=max_part_size)
+
+
+class SpoolingRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def spooling_handler(request):
+            return await handler(SpoolingRequest(request.scope, request.receive))
+
+        return spooling_handler
+
+
+# Every endpoint below is declared after this, so all of them get it
+app.router.route_class = SpoolingRoute
+
+
+@app.exception_handler(UploadTooLargeError)
+async def upload_too_large(request, exc):
+    return error_response(exc)
+
+
+async def spool_upload(file: UploadFile):
+    """
+    Takes ownership of an uploaded file as a SpooledUpload (the caller must
+    close() it). Files parsed by SpoolingMultiPartParser are already on disk;
+    anything else is copied out in chunks without ever reading it whole.
+    """
+    with timed_stage("upload_read"):
+        if isinstance(file.file, _UploadSpool):
+            file.file.claimed = True
+            upload = await run_in_threadpool(file.file.upload.finish)
+        else:
+            await file.seek(0)
+            upload = await run_in_threadpool(SpooledUpload(file.filename).copy_from, file.file)
+    record_metric("upload_bytes_total", upload.size, kind="upload")
+    return upload
+
+
+def spool_zip_member(zip_path, name):
+    with timed_stage("upload_read"), zipfile.ZipFile(zip_path) as zipf, zipf.open(name) as member:
+        upload = SpooledUpload(name).copy_from(member)
+    record_metric("upload_bytes_total", upload.size, kind="zip_member")
+    return upload
+
+
+# ------------------------------
+# Extraction dispatch
+# ------------------------------
+async def cached_extraction(kind, upload, options, compute):
+    """
+    Returns the cached result for this upload's content and options, or
+    awaits compute() and caches what it returns. Empty results (e.g. a
+    failed .ppt extraction) are not cached.
+    """
+    key = ResultCache.key(kind, upload.sha256, options)
+    result = await run_in_threadpool(extraction_cache.get, key)
+    if result is not None:
+        return result
 
+    result = await compute()
+    if result:
+        await run_in_threadpool(extraction_cache.set, key, result)
+    return result
 
-def extract_pdf_text(pdf_bytes):
+
+async def extract_pptx_incremental(upload, ocr_images=False, lang=None, baseline=None, keep_deck=True):
+    """
+    Extracts a .pptx reusing cached results of slides seen before (in any
+    deck), so a revised deck only has its changed slides extracted and OCR'd.
+
+    Args:
+        baseline: deck_id returned for an earlier version of the deck, to
+            diff against. Deck ids are random, so only the client that
+            uploaded a deck can compare with it.
+        keep_deck: Store the deck's fingerprints under a new deck_id for
+            later diffs. Only worth it when the deck_id reaches the client.
+
+    Returns:
+        dict: {"slides": list, "deck_id": str | None, "diff": dict | None}
+        where diff compares the slides with the baseline deck (see
+        diff_slide_fingerprints). diff is None without a baseline or when
+        it has expired from the cache; both are None if the deck couldn't
+        be fingerprinted. deck_id is None without keep_deck.
+    """
+    options = {"ocr_images": True, **ocr_options(lang)} if ocr_images else {}
     try:
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text.strip()
-    except:
-        return ""
+        fingerprints = await run_in_threadpool(pptx_slide_fingerprints, upload.path)
+    except Exception as e:
+        logger.warning("Could not fingerprint the slides of %s: %s", upload.filename, e)
+        slides = await cached_extraction(
+            "pptx", upload, options,
+            lambda: run_in_pool(extract_text_from_pptx_file, upload.path, ocr_images, None, lang),
+        )
+        return {"slides": slides, "deck_id": None, "diff": None}
 
+    slide_keys = [ResultCache.key("pptx-slide", fingerprint, options) for fingerprint in fingerprints]
+    cached = await run_in_threadpool(lambda: [extraction_cache.get(key) for key in slide_keys])
+    known = {number: result["text"] for number, result in enumerate(cached, start=1) if result is not None}
 
-def ocr_image(image: Image.Image):
-    gray = image.convert("L")
-    return pytesseract.image_to_string(gray, lang="eng")
+    if len(known) == len(fingerprints):
+        slides = [{"slide": number, "text": known[number]} for number in sorted(known)]
+    else:
+        slides = await run_in_pool(extract_text_from_pptx_file, upload.path, ocr_images, known, lang)
+
+    deck_id = uuid.uuid4().hex if keep_deck else None
+
+    def store():
+        results = [
+            (slide_keys[slide["slide"] - 1], {"text": slide["text"]})
+            for slide in slides
+            if slide["slide"] not in known
+        ]
+        if deck_id is not None:
+            results.append((ResultCache.key("pptx-deck", deck_id, {}), {"fingerprints": fingerprints}))
+        extraction_cache.set_many(results)
+        if baseline:
+            return extraction_cache.get(ResultCache.key("pptx-deck", baseline, {}))
+        return None
+
+    previous = await run_in_threadpool(store)
+    diff = diff_slide_fingerprints(previous["fingerprints"], fingerprints) if previous else None
+    return {"slides": slides, "deck_id": deck_id, "diff": diff}
+
+
+async def extract_pptx_slides(upload, ocr_images=False, lang=None):
+    # Callers only want the text, so there is no deck_id to keep the deck for
+    return (await extract_pptx_incremental(upload, ocr_images, lang, keep_deck=False))["slides"]
 
 
-def extract_docx_text(file_bytes):
+async def extract_ppt_slides(upload):
+    # The JVM reads the spooled file itself
+    return await cached_extraction(
+        "ppt", upload, {},
+        lambda: run_in_threadpool(extract_text_from_ppt_file, upload.path),
+    )
+
+
+async def extract_pdf(upload, pdf_backend=None, lang=None):
+    backend = get_pdf_text_backend(pdf_backend).name
+    options = {"dpi": OCR_DPI, "min_page_chars": PDF_MIN_PAGE_CHARS, "text_backend": backend, **ocr_options(lang)}
+    return await cached_extraction(
+        "pdf", upload, options,
+        lambda: run_in_pool(extract_pdf_document, upload.path, backend, lang),
+    )
+
+
+async def extract_any(upload, lang=None):
+    ext = os.path.splitext(upload.filename)[1].lower()
+    options = ocr_options(lang) if ext in (".jpg", ".jpeg", ".png", ".tiff") else {}
+    return await cached_extraction(
+        f"any{ext}", upload, options,
+        lambda: run_in_pool(extract_text_from_any, upload.path, upload.filename, lang),
+    )
+
+
+def iter_document_items(source, filename, pdf_backend=None, ocr_images=False, lang=None):
+    """
+    Yields the slides/pages of a document as they are extracted, for the
+    streaming response mode. Formats without pages yield a single item.
+    """
+    filename = filename.lower()
+    if filename.endswith(".pptx"):
+        yield from iter_pptx_slides(source, ocr_images, lang=lang)
+    elif filename.endswith(".pdf"):
+        for page in iter_pdf_pages(source, pdf_backend, lang):
+            yield dict(page, text=clean_text(page["text"]))
+    else:
+        yield {"text": extract_text_from_any(source, filename, lang)}
+
+
+async def ndjson_stream(items):
+    """
+    Serializes a (sync or async) iterator of dicts as NDJSON. An error part
+    way through is sent as a final {"error": ...} line, since the status code
+    is already out.
+    """
+    if not hasattr(items, "__aiter__"):
+        items = iterate_in_threadpool(items)
     try:
-        file_stream = io.BytesIO(file_bytes)
-        doc = Document(file_stream)
-        full_text = [p.text for p in doc.paragraphs]
-        return clean_text("\n".join(full_text))
+        async for item in items:
+            yield json.dumps(item) + "\n"
     except Exception as e:
-        raise ValueError(f"Error reading DOCX: {e}")
+        logger.exception("Streaming extraction failed")
+        yield json.dumps({"error": str(e)}) + "\n"
 
 
-def extract_text_file(file_bytes):
+async def stream_document(upload, pdf_backend=None, ocr_images=False, lang=None):
+    """
+    Streams an upload's slides/pages as NDJSON, one line per slide or page
+    as soon as it is extracted. The upload is deleted (and its admission
+    released) once the stream ends.
+
+    Raises PoolSaturatedError before anything is sent when the pool is full.
+    """
+    ticket = await admit(upload, ocr_images)
     try:
-        return clean_text(file_bytes.decode("utf-8"))
-    except:
-        return clean_text(file_bytes.decode("latin-1"))
+        if upload.filename.lower().endswith(".ppt"):
+            # The JVM pool lives in this process; its frames are read in a thread
+            items = iter_ppt_slides(upload.path)
+        else:
+            items = stream_from_pool(
+                iter_document_items, upload.path, upload.filename, pdf_backend, ocr_images, lang,
+            )
+    except BaseException:
+        ticket.release()
+        raise
 
+    async def finish():
+        ticket.release()
+        upload.close()
 
-def extract_text_from_any(file_bytes: bytes, filename: str):
-    filename = filename.lower()
+    return StreamingResponse(
+        ndjson_stream(items),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(finish),
+    )
 
-    # ----- PDF -----
+
+async def extract_document(upload, pdf_backend=None, ocr_images=False, lang=None):
+    """
+    Extracts any supported upload, returning the /extract_document_text/ response body.
+
+    Raises PoolSaturatedError when the upload's cost class is full (see admit).
+    """
+    async with admitted(upload, ocr_images):
+        return await _extract_document(upload, pdf_backend, ocr_images, lang)
+
+
+async def _extract_document(upload, pdf_backend, ocr_images, lang):
+    filename = upload.filename.lower()
+
+    # -------------------------------
+    # Handle PPTX / PPT
+    # -------------------------------
+    if filename.endswith((".pptx", ".ppt")):
+        if filename.endswith(".pptx"):
+            slides = await extract_pptx_slides(upload, ocr_images, lang)
+        else:
+            slides = await extract_ppt_slides(upload)
+
+        combined = "\n\n".join(
+            f"Slide {s['slide']}:\n{s['text']}" for s in slides
+        )
+        return {
+            "filename": filename,
+            "text": combined.strip()
+        }
+
+    # -------------------------------
+    # Handle PDF (reports which pages needed OCR, and in which languages)
+    # -------------------------------
     if filename.endswith(".pdf"):
-        extracted = extract_pdf_text(file_bytes)
-        if extracted and len(extracted) > 20:
-            return clean_text(extracted)
+        result = await extract_pdf(upload, pdf_backend, lang)
+        return {
+            "filename": filename,
+            "text": result["text"],
+            "ocr_pages": result["ocr_pages"],
+            "ocr_lang": result["ocr_lang"],
+        }
 
-        images = convert_from_bytes(file_bytes)
-        ocr_text = ""
-        for img in images:
-            ocr_text += ocr_image(img) + "\n"
-        return clean_text(ocr_text)
+    # -------------------------------
+    # Other file types (DOCX, IMG, TXT)
+    # -------------------------------
+    extracted = await extract_any(upload, lang)
+    return {"filename": filename, "text": extracted}
 
-    # ----- Images -----
-    if filename.endswith((".jpg", ".jpeg", ".png", ".tiff")):
-        img = Image.open(io.BytesIO(file_bytes))
-        return clean_text(ocr_image(img))
 
-    # ----- DOCX -----
-    if filename.endswith(".docx"):
-        return extract_docx_text(file_bytes)
+# ======================================================
+# BACKGROUND JOBS
+# ======================================================
+# Long extractions can be submitted as jobs and polled instead of holding the
+# HTTP connection open.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", EXTRACT_WORKERS))
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "100"))
+# Finished jobs (and their results) are kept this many seconds
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", "3600"))
+# Extraction time limit for jobs and batch entries (large OCR runs are what
+# they are for) instead of EXTRACT_JOB_TIMEOUT; 0 disables it
+JOB_TIMEOUT = float(os.environ.get("JOB_TIMEOUT", "3600"))
 
-    # ----- TXT -----
-    if filename.endswith(".txt"):
-        return extract_text_file(file_bytes)
+_jobs = {}
+_jobs_lock = threading.Lock()
 
-    raise ValueError("Unsupported file type for extraction.")
 
+def _count_jobs(status):
+    with _jobs_lock:
+        return sum(1 for job in _jobs.values() if job["status"] == status)
 
-# ------------------------------
-# Python .pptx extraction
-# ------------------------------
-def extract_from_shape(shape, collected):
-    if shape.has_text_frame:
-        for paragraph in shape.text_frame.paragraphs:
-            collected.append(paragraph.text)
 
-    if shape.has_table:
-        table = shape.table
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.text_frame.paragraphs:
-                    collected.append(paragraph.text)
+register_metric(Observed("jobs_queued", "Background jobs waiting for a runner.", lambda: _count_jobs("queued")))
+register_metric(Observed("jobs_running", "Background jobs being extracted.", lambda: _count_jobs("running")))
+_job_queue = None
+_job_runners = []
 
-    if shape.shape_type == 6:  # GROUPED SHAPE
-        for subshape in shape.shapes:
-            extract_from_shape(subshape, collected)
 
+def update_job_progress(job_id, done, total):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job["progress"] = {"done": done, "total": total}
 
-def extract_text_from_pptx_file(file_like):
-    prs = Presentation(file_like)
-    all_text = []
 
-    for slide_index, slide in enumerate(prs.slides):
-        slide_text = []
-        for shape in slide.shapes:
-            extract_from_shape(shape, slide_text)
+def _purge_expired_jobs():
+    now = time.time()
+    with _jobs_lock:
+        expired = [
+            job_id for job_id, job in _jobs.items()
+            if job["finished_at"] is not None and now - job["finished_at"] > JOB_RESULT_TTL
+        ]
+        for job_id in expired:
+            del _jobs[job_id]
 
-        combined = "\n".join(filter(None, slide_text))
-        all_text.append({"slide": slide_index + 1, "text": combined})
-    
-    return all_text
 
+def _finish_job(job_id, status, result=None, error=None):
+    with _jobs_lock:
+        job = _jobs[job_id]
+        job["status"] = status
+        job["result"] = result
+        job["error"] = error
+        job["finished_at"] = time.time()
+        if status == "done" and job["progress"]["done"] < job["progress"]["total"]:
+            job["progress"]["done"] = job["progress"]["total"]
 
-# ------------------------------
-# Java .ppt extraction
-# ------------------------------
-def extract_text_from_ppt_file(file_path):
-    jar_path = os.path.join(os.path.dirname(__file__), "ppt_converter/target/ppt-converter-1.0-jar-with-dependencies.jar")
 
-    
+async def extract_document_when_free(upload, pdf_backend=None, ocr_images=False, lang=None):
+    # Queued work (jobs, batches) waits for a free pool slot instead of
+    # failing with 503 like interactive requests do, and gets JOB_TIMEOUT.
+    token = extraction_timeout.set(JOB_TIMEOUT)
     try:
-        result = subprocess.run(
-            ["java", "-jar", jar_path, file_path],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-    except subprocess.CalledProcessError as e:
-        print("❌ Java extraction failed:", e)
-        print("stdout:", e.stdout)
-        print("stderr:", e.stderr)
-        return []
+        while True:
+            try:
+                return await extract_document(upload, pdf_backend, ocr_images, lang)
+            except PoolSaturatedError:
+                await asyncio.sleep(1)
+    finally:
+        extraction_timeout.reset(token)
 
-    slides_text = []
-    current_slide = 0
-    slide_lines = []
 
-    for line in result.stdout.splitlines():
-        if line.startswith("--- Slide"):
-            if slide_lines:
-                slides_text.append({"slide": current_slide, "text": "\n".join(slide_lines)})
-                slide_lines = []
+async def _run_job(job_id, upload, options):
+    with _jobs_lock:
+        _jobs[job_id]["status"] = "running"
 
-            current_slide = int(line.replace("--- Slide", "").replace("---", "").strip())
-        else:
-            slide_lines.append(line)
+    current_job_id.set(job_id)
+    try:
+        result = await extract_document_when_free(upload, *options)
+    except Exception as e:
+        logger.exception("Job %s failed", job_id)
+        _finish_job(job_id, "failed", error=str(e))
+    else:
+        _finish_job(job_id, "done", result=result)
 
-    if slide_lines:
-        slides_text.append({"slide": current_slide, "text": "\n".join(slide_lines)})
 
-    return slides_text
+async def _job_runner():
+    while True:
+        job_id, upload, options = await _job_queue.get()
+        try:
+            await _run_job(job_id, upload, options)
+        finally:
+            upload.close()
+            _job_queue.task_done()
 
 
-# ----------------------------
-# Helper to create zip in memory
-# ----------------------------
-def create_exam_package_in_memory(document_name, questions, answers):
+def submit_job(upload, pdf_backend=None, ocr_images=False, lang=None):
     """
-    Creates questions and answers Word docs in memory and zips them.
+    Queues a spooled upload for extraction (with the options of
+    extract_document); the job owns (and deletes) it.
+    """
+    global _job_queue
+    _purge_expired_jobs()
+    if _job_queue is None:
+        _job_queue = asyncio.Queue(maxsize=JOB_QUEUE_MAX)
+        _job_runners.extend(asyncio.create_task(_job_runner()) for _ in range(JOB_WORKERS))
+
+    job_id = uuid.uuid4().hex
+    with _jobs_lock:
+        _jobs[job_id] = {
+            "job_id": job_id,
+            "filename": upload.filename,
+            "status": "queued",
+            "progress": {"done": 0, "total": 1},
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+    try:
+        _job_queue.put_nowait((job_id, upload, (pdf_backend, ocr_images, lang)))
+    except asyncio.QueueFull:
+        with _jobs_lock:
+            del _jobs[job_id]
+        raise PoolSaturatedError("Too many queued jobs, try again shortly.")
+    return job_id
+
+
+def get_job(job_id):
+    _purge_expired_jobs()
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job, progress=dict(job["progress"])) if job is not None else None
+
+
+@app.on_event("shutdown")
+def shutdown_job_runners():
+    for task in _job_runners:
+        task.cancel()
+
+
+# ======================================================
+# BATCH EXTRACTION
+# ======================================================
+# Files of one batch extracted at the same time
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", EXTRACT_WORKERS))
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "500"))
+
+
+def _zip_members(zip_path):
+    # Regular files only; skips folders and macOS resource forks
+    with zipfile.ZipFile(zip_path) as zipf:
+        return [
+            info.filename for info in zipf.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith("__MACOSX/")
+            and not os.path.basename(info.filename).startswith(".")
+        ]
+
+
+async def iter_batch_results(entries, spooled, pdf_backend=None, ocr_images=False, lang=None):
+    """
+    Extracts (filename, load) entries concurrently, where load() returns a
+    SpooledUpload, yielding one NDJSON line per file in the order they
+    finish. The `spooled` uploads the entries came from are deleted at the end.
+    The other arguments are passed on to extract_document.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def extract_entry(filename, load):
+        async with semaphore:
+            try:
+                upload = await run_in_threadpool(load)
+            except Exception as e:
+                return {"filename": filename, "error": str(e)}
+            try:
+                result = await extract_document_when_free(upload, pdf_backend, ocr_images, lang)
+                # The entry's own name, as on error lines (not the lowercased one)
+                return dict(result, filename=filename)
+            except Exception as e:
+                return {"filename": filename, "error": str(e)}
+            finally:
+                if upload not in spooled:
+                    upload.close()
+
+    tasks = [asyncio.create_task(extract_entry(filename, load)) for filename, load in entries]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield json.dumps(await finished) + "\n"
+    finally:
+        # Client went away: don't keep extracting for nobody
+        for task in tasks:
+            task.cancel()
+        for upload in spooled:
+            upload.close()
+
+
+# ======================================================
+# BULK EXAM GENERATION
+# ======================================================
+EXAM_BULK_MAX = int(os.environ.get("EXAM_BULK_MAX", "1000"))
+# Exams built at once; finished documents are zipped before more are started
+EXAM_BULK_CONCURRENCY = int(os.environ.get("EXAM_BULK_CONCURRENCY", EXTRACT_WORKERS))
+
+
+def _manifest_lines(value, field, name):
+    # Questions/answers may be given as a list of lines or as one text block
+    if isinstance(value, str):
+        return value.splitlines()
+    if isinstance(value, list) and all(isinstance(line, str) for line in value):
+        return value
+    raise ValueError(f"{name}: '{field}' must be text or a list of strings")
+
+
+def parse_exam_manifest(filename, data):
+    """
+    Reads a bulk exam manifest, either JSON (a list of objects, or
+    {"exams": [...]}) or CSV with a header row. Every exam has a
+    document_name, questions and answers; in CSV the questions and answers
+    cells hold one question or answer per line.
 
     Returns:
-        BytesIO: The zip file as a BytesIO object.
+        list[tuple[str, list[str], list[str]]]: (document_name, questions, answers)
     """
-    # In-memory Word docs
-    questions_io = BytesIO()
-    answers_io = BytesIO()
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith(".csv") or not text.lstrip().startswith(("[", "{")):
+        rows = list(csv.DictReader(io.StringIO(text)))
+        missing = {"document_name", "questions", "answers"} - set(rows[0] if rows else ())
+        if missing:
+            raise ValueError(f"Manifest CSV is missing columns: {', '.join(sorted(missing))}")
+    else:
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Manifest is not valid JSON: {e}")
+        if isinstance(rows, dict):
+            rows = rows.get("exams")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("Manifest JSON must be a list of exams or {\"exams\": [...]}")
 
-    # ------------------
-    # Questions doc
-    # ------------------
-    doc_q = Document()
-    doc_q.add_heading(f"{document_name} - Questions", level=1)
-    for q in questions:  # ✅ Removed enumerate
-        if q.strip():  # Only add non-empty lines
-            para = doc_q.add_paragraph(q)  # ✅ No numbering added here
-            para.paragraph_format.space_after = Pt(6)
-    doc_q.save(questions_io)
-    questions_io.seek(0)  # reset pointer
+    if not rows:
+        raise ValueError("Manifest has no exams.")
 
-    # ------------------
-    # Answers doc
-    # ------------------
-    doc_a = Document()
-    doc_a.add_heading(f"{document_name} - Answers", level=1)
-    for a in answers:  # ✅ Removed enumerate
-        if a.strip():  # Only add non-empty lines
-            para = doc_a.add_paragraph(a)  # ✅ No numbering added here
-            para.paragraph_format.space_after = Pt(6)
-    doc_a.save(answers_io)
-    answers_io.seek(0)
+    exams = []
+    seen = set()
+    for number, row in enumerate(rows, start=1):
+        name = row.get("document_name")
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError(f"Exam {number}: document_name is required")
+        name = name.strip()
+        if "/" in name or "\\" in name or name in (".", ".."):
+            raise ValueError(f"Exam {number}: document_name can't be used as a file name: {name!r}")
+        if name in seen:
+            raise ValueError(f"Exam {number}: duplicate document_name {name!r}")
+        seen.add(name)
 
-    # ------------------
-    # Create zip in memory
-    # ------------------
-    zip_io = BytesIO()
-    with zipfile.ZipFile(zip_io, mode="w") as zipf:
-        zipf.writestr(f"{document_name}_questions.docx", questions_io.getvalue())
-        zipf.writestr(f"{document_name}_answers.docx", answers_io.getvalue())
-    zip_io.seek(0)
+        exams.append((
+            name,
+            _manifest_lines(row.get("questions", ""), "questions", name),
+            _manifest_lines(row.get("answers", ""), "answers", name),
+        ))
+    return exams
+
+
+async def _build_exam_docx_when_free(title, lines):
+    # Like extract_document_when_free: wait for a pool slot rather than fail
+    while True:
+        try:
+            return await run_in_pool(build_exam_docx, title, lines)
+        except PoolSaturatedError:
+            await asyncio.sleep(1)
 
-    return zip_io
+
+async def _build_exam(name, questions, answers):
+    return await asyncio.gather(
+        _build_exam_docx_when_free(f"{name} - Questions", questions),
+        _build_exam_docx_when_free(f"{name} - Answers", answers),
+    )
+
+
+async def iter_bulk_exam_zip(exams):
+    """
+    Builds every exam in the worker pool and streams one zip with a folder
+    per exam. At most EXAM_BULK_CONCURRENCY exams are in flight, and each is
+    written to the zip (and dropped) as soon as it is done, so memory doesn't
+    grow with the size of the batch. Exams that fail are listed in
+    errors.json at the end of the archive.
+    """
+    archive = ZipStream()
+    errors = []
+    remaining = iter(exams)
+    pending = {}
+
+    def start_next():
+        for name, questions, answers in remaining:
+            pending[asyncio.create_task(_build_exam(name, questions, answers))] = name
+            return
+
+    try:
+        for _ in range(EXAM_BULK_CONCURRENCY):
+            start_next()
+
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = pending.pop(task)
+                start_next()
+                try:
+                    questions_docx, answers_docx = task.result()
+                except Exception as e:
+                    logger.exception("Building exam %s failed", name)
+                    errors.append({"document_name": name, "error": str(e)})
+                    continue
+                for chunk in archive.add(f"{name}/{name}_questions.docx", questions_docx):
+                    yield chunk
+                for chunk in archive.add(f"{name}/{name}_answers.docx", answers_docx):
+                    yield chunk
+
+        if errors:
+            for chunk in archive.add("errors.json", json.dumps(errors, indent=2).encode("utf-8")):
+                yield chunk
+        for chunk in archive.close():
+            yield chunk
+    finally:
+        # Client went away: don't keep building for nobody
+        for task in pending:
+            task.cancel()
+
+
+def error_response(e):
+    if isinstance(e, UploadTooLargeError):
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    if isinstance(e, PoolSaturatedError):
+        return JSONResponse(
+            status_code=503, content={"error": str(e)}, headers={"Retry-After": str(e.retry_after)},
+        )
+    return JSONResponse(status_code=504, content={"error": str(e)})
 
 
 # ------------------------------
 # API endpoint
 # ------------------------------
 @app.post("/extract_document_text/")
-async def extract_document_text(file: UploadFile = File(...)):
-    contents = await file.read()
-    filename = file.filename.lower()
-
+async def extract_document_text(
+    file: UploadFile = File(...),
+    stream: bool = False,
+    pdf_backend: Optional[str] = None,
+    ocr_images: bool = False,
+    lang: Optional[str] = None,
+):
+    # pdf_backend picks the PDF text layer engine (auto, pypdf, pypdf2, pdftotext);
+    # ocr_images adds the text of pictures on .pptx slides;
+    # lang is the OCR language(s): "eng", "eng+deu", ... or "auto" to detect it
     try:
-        # -------------------------------
-        # Handle PPTX
-        # -------------------------------
-        if filename.endswith(".pptx"):
-            file_like = BytesIO(contents)
-            slides = extract_text_from_pptx_file(file_like)
+        get_pdf_text_backend(pdf_backend)
+        lang = check_ocr_lang(lang)
+    except ValueError as e:
+        return {"error": str(e)}
 
-            combined = "\n\n".join(
-                f"Slide {s['slide']}:\n{s['text']}" for s in slides
-            )
-            return {
-                "filename": filename,
-                "text": combined.strip()
-            }
-
-        # -------------------------------
-        # Handle PPT
-        # -------------------------------
-        if filename.endswith(".ppt"):
-            # Save temp file for Java extractor
-            temp_path = os.path.join(os.path.dirname(__file__), filename)
-            with open(temp_path, "wb") as f:
-                f.write(contents)
-
-            slides = extract_text_from_ppt_file(temp_path)
-            os.remove(temp_path)  # Clean temp file
-
-            combined = "\n\n".join(
-                f"Slide {s['slide']}:\n{s['text']}" for s in slides
-            )
-            return {
-                "filename": filename,
-                "text": combined.strip()
-            }
+    try:
+        upload = await spool_upload(file)
+    except UploadTooLargeError as e:
+        return error_response(e)
 
-        # -------------------------------
-        # Other file types (PDF, DOCX, IMG, TXT)
-        # -------------------------------
-        extracted = extract_text_from_any(contents, filename)
-        return {"filename": filename, "text": extracted}
+    if stream:
+        try:
+            return await stream_document(upload, pdf_backend, ocr_images, lang)
+        except PoolSaturatedError as e:
+            upload.close()
+            return error_response(e)
 
+    try:
+        return await extract_document(upload, pdf_backend, ocr_images, lang)
+    except (PoolSaturatedError, ExtractionTimeoutError) as e:
+        return error_response(e)
     except Exception as e:
+        logger.exception("Extraction of %s failed", upload.filename)
+        return {"error": str(e)}
+    finally:
+        upload.close()
+
+
+@app.post("/jobs/extract_document_text/")
+async def submit_extract_document_job(
+    file: UploadFile = File(...),
+    pdf_backend: Optional[str] = None,
+    ocr_images: bool = False,
+    lang: Optional[str] = None,
+):
+    """
+    Queues an extraction and returns its job id immediately. Poll
+    /jobs/{job_id} for status and progress, then fetch /jobs/{job_id}/result.
+    Takes the same options as /extract_document_text/.
+    """
+    try:
+        get_pdf_text_backend(pdf_backend)
+        lang = check_ocr_lang(lang)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    try:
+        upload = await spool_upload(file)
+    except UploadTooLargeError as e:
+        return error_response(e)
+
+    try:
+        job_id = submit_job(upload, pdf_backend, ocr_images, lang)
+    except PoolSaturatedError as e:
+        upload.close()
+        return error_response(e)
+
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued"})
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown or expired job."})
+
+    status = {key: job[key] for key in ("job_id", "filename", "status", "progress")}
+    if job["error"] is not None:
+        status["error"] = job["error"]
+    return status
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown or expired job."})
+    if job["status"] == "failed":
+        return {"error": job["error"]}
+    if job["status"] != "done":
+        return JSONResponse(
+            status_code=409,
+            content={"error": f"Job is {job['status']}.", "progress": job["progress"]},
+        )
+    return job["result"]
+
+
+@app.post("/extract_batch/")
+async def extract_batch(
+    files: List[UploadFile] = File(...),
+    pdf_backend: Optional[str] = None,
+    ocr_images: bool = False,
+    lang: Optional[str] = None,
+):
+    """
+    Extracts many documents in one request. Accepts several files and/or zip
+    archives (expanded into their members) and streams one NDJSON line per
+    document as each finishes, so fast formats aren't held up by slow OCR.
+    The options apply to every document, as in /extract_document_text/.
+    """
+    try:
+        get_pdf_text_backend(pdf_backend)
+        lang = check_ocr_lang(lang)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    spooled = []
+    entries = []
+    try:
+        for file in files:
+            upload = await spool_upload(file)
+            spooled.append(upload)
+            if not file.filename.lower().endswith(".zip"):
+                entries.append((file.filename, lambda upload=upload: upload))
+                continue
+
+            try:
+                members = _zip_members(upload.path)
+            except zipfile.BadZipFile as e:
+                raise ValueError(f"{file.filename}: {e}")
+            # Members are spooled out of the archive only when their turn comes
+            entries.extend(
+                (name, lambda path=upload.path, name=name: spool_zip_member(path, name))
+                for name in members
+            )
+    except UploadTooLargeError as e:
+        for upload in spooled:
+            upload.close()
+        return error_response(e)
+    except ValueError as e:
+        for upload in spooled:
+            upload.close()
         return {"error": str(e)}
 
+    if len(entries) > BATCH_MAX_FILES:
+        for upload in spooled:
+            upload.close()
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"Batch has {len(entries)} files, the limit is {BATCH_MAX_FILES}."},
+        )
+
+    return StreamingResponse(
+        iter_batch_results(entries, spooled, pdf_backend, ocr_images, lang), media_type="application/x-ndjson"
+    )
+
 
 @app.post("/extract_text/")
-async def extract_text(file: UploadFile = File(...)):
+async def extract_text(
+    file: UploadFile = File(...),
+    stream: bool = False,
+    ocr_images: bool = False,
+    lang: Optional[str] = None,
+    baseline: Optional[str] = None,
+):
+    # ocr_images (.pptx only) adds the OCR'd text of pictures to their slides,
+    # in lang ("eng", "eng+deu", ... or "auto");
+    # baseline (.pptx only) is the deck_id of an earlier version to diff against
     # Ensure only .pptx or .ppt
     ext = os.path.splitext(file.filename)[1].lower()
     if ext not in (".pptx", ".ppt"):
         return {"error": "File must be a .pptx or .ppt"}
+    try:
+        lang = check_ocr_lang(lang)
+    except ValueError as e:
+        return {"error": str(e)}
 
-    # Save uploaded file temporarily if it's a .ppt (Java needs a file path)
-    if ext == ".ppt":
-        temp_path = os.path.join(os.path.dirname(__file__), file.filename)
-        with open(temp_path, "wb") as f:
-            f.write(await file.read())
+    try:
+        upload = await spool_upload(file)
+    except UploadTooLargeError as e:
+        return error_response(e)
+
+    if stream:
+        try:
+            return await stream_document(upload, ocr_images=ocr_images, lang=lang)
+        except PoolSaturatedError as e:
+            upload.close()
+            return error_response(e)
+
+    try:
+        async with admitted(upload, ocr_images):
+            if ext == ".ppt":
+                return {"filename": file.filename, "slides": await extract_ppt_slides(upload)}
+
+            result = await extract_pptx_incremental(upload, ocr_images, lang, baseline)
+    except (PoolSaturatedError, ExtractionTimeoutError) as e:
+        return error_response(e)
+    finally:
+        upload.close()
 
-        slides_text = extract_text_from_ppt_file(temp_path)
+    # diff: slides changed since the baseline deck
+    return {
+        "filename": file.filename,
+        "slides": result["slides"],
+        "deck_id": result["deck_id"],
+        "diff": result["diff"],
+    }
 
-        # Optionally remove temp file
-        os.remove(temp_path)
 
-        return {"filename": file.filename, "slides": slides_text}
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "ppt_workers": ppt_workers.health(),
+        "cache": extraction_cache.stats(),
+        "admission": {name: c.stats() for name, c in admission_classes.items()},
+    }
 
-    # For .pptx, read in memory
-    contents = await file.read()
-    file_like = BytesIO(contents)
-    slides_text = extract_text_from_pptx_file(file_like)
-    
-    return {"filename": file.filename, "slides": slides_text}
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 @app.post("/generate_exam_zip/")
@@ -320,12 +3637,48 @@ async def generate_exam_zip(
     questions_text = (await questions_file.read()).decode("utf-8").splitlines()
     answers_text = (await answers_file.read()).decode("utf-8").splitlines()
 
-    # Create zip in memory
-    zip_io = create_exam_package_in_memory(document_name, questions_text, answers_text)
+    # Both documents are built at the same time in the worker pool
+    try:
+        questions_docx, answers_docx = await asyncio.gather(
+            run_in_pool(build_exam_docx, f"{document_name} - Questions", questions_text),
+            run_in_pool(build_exam_docx, f"{document_name} - Answers", answers_text),
+        )
+    except (PoolSaturatedError, ExtractionTimeoutError) as e:
+        return error_response(e)
 
-    # Return as downloadable file
+    files = [
+        (f"{document_name}_questions.docx", questions_docx),
+        (f"{document_name}_answers.docx", answers_docx),
+    ]
+
+    # Return as downloadable file, zipped as it is sent
     return StreamingResponse(
-        zip_io,
+        timed_iter("zip_build", iter_zip_stream(files)),
         media_type="application/x-zip-compressed",
         headers={"Content-Disposition": f"attachment; filename={document_name}.zip"}
-    )
\ No newline at end of file
+    )
+
+
+@app.post("/generate_exam_zip/bulk/")
+async def generate_exam_zip_bulk(manifest: UploadFile = File(...), archive_name: str = "exams"):
+    """
+    Accepts a manifest (JSON or CSV, see parse_exam_manifest) of many exams
+    and streams back one zip with a questions and an answers document for
+    each exam, in a folder named after it.
+    """
+    try:
+        exams = parse_exam_manifest(manifest.filename or "", await manifest.read())
+    except (ValueError, UnicodeDecodeError) as e:
+        return {"error": str(e)}
+
+    if len(exams) > EXAM_BULK_MAX:
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"Manifest has {len(exams)} exams, the limit is {EXAM_BULK_MAX}."},
+        )
+
+    return StreamingResponse(
+        iter_bulk_exam_zip(exams),
+        media_type="application/x-zip-compressed",
+        headers={"Content-Disposition": f"attachment; filename={archive_name}.zip"}
+    )
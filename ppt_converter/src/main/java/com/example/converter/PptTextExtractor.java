@@ -1,71 +1,258 @@
 package com.example.converter;
 
 import org.apache.poi.hslf.usermodel.*;
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.EOFException;
 import java.io.FileInputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.List;
 
 public class PptTextExtractor {
 
+    // Server mode frames: 1 byte type, 4 byte big-endian length, payload
+    private static final byte OP_PING = 'P';
+    private static final byte OP_EXTRACT = 'X';       // payload is the document itself
+    private static final byte OP_EXTRACT_FILE = 'F';  // payload is a UTF-8 file path
+    private static final byte OP_QUIT = 'Q';
+
+    private static final byte REPLY_PONG = 'P';
+    private static final byte REPLY_SLIDE = 'S';      // one JSON object per slide
+    private static final byte REPLY_DONE = 'D';
+    private static final byte REPLY_ERROR = 'E';
+
+    /** A text shape (rows == null) or a table (text == null) on a slide. */
+    private static final class Block {
+        final String text;
+        final List<List<String>> rows;
+
+        Block(String text, List<List<String>> rows) {
+            this.text = text;
+            this.rows = rows;
+        }
+    }
+
+    private interface SlideSink {
+        void accept(int slideNum, List<Block> blocks) throws IOException;
+    }
+
     public static void main(String[] args) throws Exception {
-        if (args.length != 1) {
-            System.out.println("Usage: java -jar ppt-text-extractor.jar input.ppt");
+        if (args.length == 1 && args[0].equals("--server")) {
+            serve();
+            return;
+        }
+
+        boolean json = args.length == 2 && args[0].equals("--json");
+        if (args.length != 1 && !json) {
+            System.out.println("Usage: java -jar ppt-text-extractor.jar [--json] input.ppt");
+            System.out.println("       java -jar ppt-text-extractor.jar [--json] - < input.ppt");
+            System.out.println("       java -jar ppt-text-extractor.jar --server");
             return;
         }
 
-        String inputPath = args[0];
-        HSLFSlideShow ppt = new HSLFSlideShow(new FileInputStream(inputPath));
+        String inputPath = args[args.length - 1];
+        try (InputStream in = inputPath.equals("-") ? System.in : new FileInputStream(inputPath)) {
+            extractSlides(in, (slideNum, blocks) -> {
+                if (json) {
+                    System.out.println(slideJson(slideNum, blocks));
+                    return;
+                }
+
+                System.out.println("--- Slide " + slideNum + " ---");
+                for (Block block : blocks) {
+                    if (block.rows == null) {
+                        System.out.println(block.text);
+                        continue;
+                    }
+                    for (List<String> row : block.rows) {
+                        for (String cell : row) {
+                            if (!cell.isEmpty()) {
+                                System.out.println(cell);
+                            }
+                        }
+                    }
+                }
+                System.out.println();
+            });
+        }
+    }
+
+    /**
+     * Long-lived worker mode: reads framed jobs from stdin and answers each
+     * with one frame per slide followed by a done (or error) frame, so one
+     * warm JVM serves many documents and callers can consume slides as they
+     * are produced.
+     */
+    private static void serve() throws IOException {
+        DataInputStream in = new DataInputStream(new BufferedInputStream(System.in));
+        DataOutputStream out = new DataOutputStream(new BufferedOutputStream(System.out));
+        // Anything else that prints (POI warnings, etc.) must not corrupt the frames
+        System.setOut(new PrintStream(System.err, true));
 
-        int slideNum = 1;
-        for (HSLFSlide slide : ppt.getSlides()) {
-            System.out.println("--- Slide " + slideNum + " ---");
+        while (true) {
+            byte op;
+            byte[] payload;
+            try {
+                op = in.readByte();
+                payload = new byte[in.readInt()];
+                in.readFully(payload);
+            } catch (EOFException e) {
+                return;
+            }
+
+            if (op == OP_QUIT) {
+                return;
+            }
 
-            for (HSLFShape shape : slide.getShapes()) {
-                extractShapeText(shape);
+            if (op == OP_PING) {
+                writeFrame(out, REPLY_PONG, new byte[0]);
+                continue;
             }
 
-            slideNum++;
-            System.out.println();
+            if (op != OP_EXTRACT && op != OP_EXTRACT_FILE) {
+                writeFrame(out, REPLY_ERROR, ("Unknown operation: " + (char) op).getBytes(StandardCharsets.UTF_8));
+                continue;
+            }
+
+            try (InputStream docStream = op == OP_EXTRACT
+                    ? new ByteArrayInputStream(payload)
+                    : new FileInputStream(new String(payload, StandardCharsets.UTF_8))) {
+                extractSlides(docStream, (slideNum, blocks) ->
+                        writeFrame(out, REPLY_SLIDE, slideJson(slideNum, blocks).getBytes(StandardCharsets.UTF_8)));
+                writeFrame(out, REPLY_DONE, new byte[0]);
+            } catch (Exception e) {
+                writeFrame(out, REPLY_ERROR, String.valueOf(e).getBytes(StandardCharsets.UTF_8));
+            }
         }
+    }
+
+    private static void writeFrame(DataOutputStream out, byte type, byte[] payload) throws IOException {
+        out.writeByte(type);
+        out.writeInt(payload.length);
+        out.write(payload);
+        out.flush();
+    }
 
-        ppt.close();
+    private static void extractSlides(InputStream in, SlideSink sink) throws IOException {
+        try (HSLFSlideShow ppt = new HSLFSlideShow(in)) {
+            int slideNum = 1;
+            for (HSLFSlide slide : ppt.getSlides()) {
+                List<Block> blocks = new ArrayList<>();
+                for (HSLFShape shape : slide.getShapes()) {
+                    extractShapeText(shape, blocks);
+                }
+
+                sink.accept(slideNum, blocks);
+                slideNum++;
+            }
+        }
     }
 
-    private static void extractShapeText(HSLFShape shape) {
+    private static void extractShapeText(HSLFShape shape, List<Block> blocks) {
         // 1️⃣ Text shapes
         if (shape instanceof HSLFTextShape) {
             HSLFTextShape textShape = (HSLFTextShape) shape;
             String text = textShape.getText();
             if (text != null && !text.isEmpty()) {
-                System.out.println(text);
+                blocks.add(new Block(text, null));
             }
         }
 
-        // 2️⃣ Tables
+        // 2️⃣ Tables (HSLFTable is also a group shape, so it is not recursed
+        // into below, which would emit every cell a second time)
         if (shape instanceof HSLFTable) {
             HSLFTable table = (HSLFTable) shape;
             int rows = table.getNumberOfRows();
             int cols = table.getNumberOfColumns();
 
+            List<List<String>> tableRows = new ArrayList<>();
             for (int r = 0; r < rows; r++) {
+                List<String> row = new ArrayList<>();
                 for (int c = 0; c < cols; c++) {
                     HSLFTableCell cell = table.getCell(r, c);
+                    String text = null;
                     if (cell != null) {
                         // Get the text from the list of paragraphs
-                        String text = HSLFTextParagraph.getText(cell.getTextParagraphs());
-                        if (text != null && !text.isEmpty()) {
-                            System.out.println(text);
-                        }
-
+                        text = HSLFTextParagraph.getText(cell.getTextParagraphs());
                     }
+                    row.add(text == null ? "" : text);
                 }
+                tableRows.add(row);
             }
+            blocks.add(new Block(null, tableRows));
+            return;
         }
 
         // 3️⃣ Grouped shapes (recursively)
         if (shape instanceof HSLFGroupShape) {
             HSLFGroupShape group = (HSLFGroupShape) shape;
             for (HSLFShape subShape : group.getShapes()) {
-                extractShapeText(subShape);
+                extractShapeText(subShape, blocks);
+            }
+        }
+    }
+
+    private static String slideJson(int slideNum, List<Block> blocks) {
+        StringBuilder sb = new StringBuilder();
+        sb.append("{\"slide\":").append(slideNum).append(",\"blocks\":[");
+        for (int i = 0; i < blocks.size(); i++) {
+            Block block = blocks.get(i);
+            if (i > 0) {
+                sb.append(',');
+            }
+
+            if (block.rows == null) {
+                sb.append("{\"type\":\"text\",\"text\":");
+                appendJsonString(sb, block.text);
+                sb.append('}');
+                continue;
+            }
+
+            sb.append("{\"type\":\"table\",\"rows\":[");
+            for (int r = 0; r < block.rows.size(); r++) {
+                if (r > 0) {
+                    sb.append(',');
+                }
+                sb.append('[');
+                List<String> row = block.rows.get(r);
+                for (int c = 0; c < row.size(); c++) {
+                    if (c > 0) {
+                        sb.append(',');
+                    }
+                    appendJsonString(sb, row.get(c));
+                }
+                sb.append(']');
+            }
+            sb.append("]}");
+        }
+        return sb.append("]}").toString();
+    }
+
+    private static void appendJsonString(StringBuilder sb, String value) {
+        sb.append('"');
+        for (int i = 0; i < value.length(); i++) {
+            char ch = value.charAt(i);
+            switch (ch) {
+                case '"': sb.append("\\\""); break;
+                case '\\': sb.append("\\\\"); break;
+                case '\n': sb.append("\\n"); break;
+                case '\r': sb.append("\\r"); break;
+                case '\t': sb.append("\\t"); break;
+                default:
+                    if (ch < 0x20) {
+                        sb.append(String.format("\\u%04x", (int) ch));
+                    } else {
+                        sb.append(ch);
+                    }
             }
         }
+        sb.append('"');
     }
 }
@@ -0,0 +1,429 @@
+"""
+Benchmarks every extractor and endpoint on generated fixtures.
+
+Each case runs in a fresh process so its peak RSS is its own. Cases are run
+in-process (calling app.py functions directly) and over HTTP against the
+FastAPI app (httpx ASGITransport, requests sent concurrently). The result
+cache is disabled so every request does the full work.
+
+Usage:
+    python test/benchmark.py                          # everything, JSON to stdout
+    python test/benchmark.py --mode http --only pdf   # a subset
+    python test/benchmark.py --ppt deck.ppt           # include .ppt (needs Java)
+    python test/benchmark.py --output new.json --compare old.json
+
+Cases whose tools are missing here (tesseract, pdftoppm, java, a .ppt
+sample) are reported as skipped with the reason.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SAMPLE_TXT = os.path.join(ROOT, "txt", "ch01.txt")
+
+# Fixture sizes; --quick divides the large ones by 10
+SIZES = {
+    "pdf_text_pages": 100,
+    "pdf_scanned_pages": 5,
+    "pptx_slides": 300,
+    "docx_paragraphs": 20000,
+    "exam_questions": 2000,
+}
+IMAGE_SIZES = {"1mp": (1000, 1000), "4mp": (2000, 2000), "12mp": (4000, 3000)}
+
+
+# ------------------------------
+# Fixtures
+# ------------------------------
+def sample_lines():
+    with open(SAMPLE_TXT, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("---")]
+
+
+def pdf_escape(text):
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(path, pages):
+    # Minimal PDF with a Helvetica text layer, one content stream per page
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        ops = ["BT /F1 11 Tf 14 TL 56 780 Td"] + [f"({pdf_escape(line)}) '" for line in lines] + ["ET"]
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def render_text_image(size, lines, font_size):
+    from PIL import Image, ImageDraw, ImageFont
+
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", font_size)
+    except OSError:
+        font = ImageFont.load_default(size=font_size)
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    y = font_size * 2
+    for line in lines:
+        if y > size[1] - font_size * 3:
+            break
+        draw.text((font_size * 2, y), line, fill=0, font=font)
+        y += int(font_size * 1.6)
+    return image
+
+
+def build_fixtures(directory, sizes):
+    from docx import Document
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    lines = sample_lines()
+
+    def cycle(count, offset=0):
+        return [lines[(offset + i) % len(lines)] for i in range(count)]
+
+    fixtures = {"txt": SAMPLE_TXT}
+
+    path = os.path.join(directory, "text.pdf")
+    write_text_pdf(path, [cycle(50, page * 50) for page in range(sizes["pdf_text_pages"])])
+    fixtures["pdf_text"] = path
+
+    path = os.path.join(directory, "scanned.pdf")
+    pages = [render_text_image((1654, 2339), cycle(40, page * 40), 28) for page in range(sizes["pdf_scanned_pages"])]
+    pages[0].save(path, save_all=True, append_images=pages[1:], resolution=200)
+    fixtures["pdf_scanned"] = path
+
+    for name, size in IMAGE_SIZES.items():
+        path = os.path.join(directory, f"image_{name}.png")
+        render_text_image(size, cycle(200), max(16, size[1] // 60)).save(path)
+        fixtures[f"image_{name}"] = path
+
+    prs = Presentation()
+    for i in range(sizes["pptx_slides"]):
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = lines[i % len(lines)]
+        slide.placeholders[1].text = "\n".join(cycle(6, i))
+        if i % 10 == 0:
+            table = slide.shapes.add_table(4, 3, Inches(1), Inches(5), Inches(6), Inches(1)).table
+            for r in range(4):
+                for c in range(3):
+                    table.cell(r, c).text = lines[(i + r * 3 + c) % len(lines)]
+    path = os.path.join(directory, "deck.pptx")
+    prs.save(path)
+    fixtures["pptx"] = path
+
+    doc = Document()
+    for i, line in enumerate(cycle(sizes["docx_paragraphs"])):
+        if i % 500 == 0:
+            doc.add_heading(line, level=1)
+            table = doc.add_table(rows=3, cols=3)
+            for cell in table._cells:
+                cell.text = line
+        doc.add_paragraph(line)
+    path = os.path.join(directory, "large.docx")
+    doc.save(path)
+    fixtures["docx"] = path
+
+    return fixtures
+
+
+# ------------------------------
+# Cases
+# ------------------------------
+def tool_missing(*tools):
+    for tool in tools:
+        if shutil.which(tool) is None:
+            return f"{tool} not found"
+    return None
+
+
+def define_cases(fixtures, ppt_path, sizes):
+    """Returns {name: (missing requirement or None, call spec)}."""
+    exam_lines = sample_lines()
+    exam_lines = (exam_lines * (sizes["exam_questions"] // len(exam_lines) + 1))[:sizes["exam_questions"]]
+    ocr = tool_missing("tesseract")
+    pdf_ocr = tool_missing("pdftoppm", "tesseract")
+
+    cases = {
+        "any_txt": (None, ("any", fixtures["txt"], "ch01.txt")),
+        "any_docx": (None, ("any", fixtures["docx"], "large.docx")),
+        "any_pdf_text": (None, ("any", fixtures["pdf_text"], "text.pdf")),
+        "any_pdf_scanned": (pdf_ocr, ("any", fixtures["pdf_scanned"], "scanned.pdf")),
+        "pptx": (None, ("pptx", fixtures["pptx"], "deck.pptx")),
+        "exam_package": (None, ("exam", "\n".join(exam_lines), "\n".join(reversed(exam_lines)))),
+        "exam_package_streamed": (None, ("exam_streamed", "\n".join(exam_lines), "\n".join(reversed(exam_lines)))),
+    }
+    for name in IMAGE_SIZES:
+        cases[f"any_image_{name}"] = (ocr, ("any", fixtures[f"image_{name}"], f"image_{name}.png"))
+
+    if ppt_path is None:
+        cases["ppt"] = ("no .ppt sample given (--ppt)", None)
+    else:
+        import app
+
+        problem = tool_missing("java") or (None if os.path.exists(app.PPT_JAR_PATH) else "converter jar not built")
+        cases["ppt"] = (problem, ("ppt", ppt_path, os.path.basename(ppt_path)))
+    return cases
+
+
+def call_in_process(spec):
+    import app
+
+    kind = spec[0]
+    if kind == "any":
+        return app.extract_text_from_any(spec[1], spec[2])
+    if kind == "pptx":
+        return app.extract_text_from_pptx_file(spec[1])
+    if kind == "ppt":
+        result = app.extract_text_from_ppt_file(spec[1])
+        if not result:
+            raise RuntimeError(".ppt extraction returned nothing")
+        return result
+    if kind == "exam":
+        return app.create_exam_package_in_memory("bench", spec[1].splitlines(), spec[2].splitlines())
+    if kind == "exam_streamed":
+        files = [
+            ("questions.docx", app.build_exam_docx("bench - Questions", spec[1].splitlines())),
+            ("answers.docx", app.build_exam_docx("bench - Answers", spec[2].splitlines())),
+        ]
+        return sum(len(chunk) for chunk in app.iter_zip_stream(files))
+    raise ValueError(kind)
+
+
+def http_request(client, spec):
+    kind = spec[0]
+    if kind.startswith("exam"):
+        return client.post(
+            "/generate_exam_zip/",
+            params={"document_name": "bench"},
+            files={"questions_file": ("q.txt", spec[1].encode()), "answers_file": ("a.txt", spec[2].encode())},
+        )
+
+    with open(spec[1], "rb") as f:
+        data = f.read()
+    url = "/extract_text/" if kind in ("pptx", "ppt") else "/extract_document_text/"
+    return client.post(url, files={"file": (spec[2], data)})
+
+
+# ------------------------------
+# Measurement (runs in a fresh process per case)
+# ------------------------------
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, wall, input_bytes):
+    return {
+        "iterations": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "throughput_per_s": round(len(latencies) / wall, 3),
+        "throughput_mb_per_s": round(input_bytes * len(latencies) / wall / 1e6, 3),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 1e6, 1),
+    }
+
+
+def input_size(spec):
+    if spec[0].startswith("exam"):
+        return len(spec[1]) + len(spec[2])
+    return os.path.getsize(spec[1])
+
+
+def measure_in_process(spec, iterations):
+    start = time.perf_counter()
+    call_in_process(spec)
+    warmup = time.perf_counter() - start
+
+    latencies = []
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call_in_process(spec)
+        latencies.append(time.perf_counter() - start)
+    wall = time.perf_counter() - wall_start
+    return {"warmup_ms": round(warmup * 1000, 2), **summarize(latencies, wall, input_size(spec))}
+
+
+async def measure_http(spec, iterations, concurrency):
+    import httpx
+    import app
+
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def timed():
+            start = time.perf_counter()
+            response = await http_request(client, spec)
+            await response.aread()
+            elapsed = time.perf_counter() - start
+            failed = response.status_code != 200
+            if not failed and response.headers.get("content-type") == "application/json":
+                failed = "error" in response.json()
+            if failed:
+                raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+            return elapsed
+
+        start = time.perf_counter()
+        await timed()
+        warmup = time.perf_counter() - start
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with semaphore:
+                return await timed()
+
+        wall_start = time.perf_counter()
+        latencies = await asyncio.gather(*(limited() for _ in range(iterations)))
+        wall = time.perf_counter() - wall_start
+
+    # Stop the app's worker pools so their peak RSS is counted as children
+    for handler in app.app.router.on_shutdown:
+        handler()
+    result = {"warmup_ms": round(warmup * 1000, 2), "concurrency": concurrency}
+    result.update(summarize(latencies, wall, input_size(spec)))
+    return result
+
+
+def run_case(mode, spec, iterations, concurrency, results):
+    sys.path.insert(0, ROOT)
+    os.environ["EXTRACT_CACHE_BACKEND"] = "none"
+    try:
+        if mode == "in_process":
+            result = measure_in_process(spec, iterations)
+        else:
+            result = asyncio.run(measure_http(spec, iterations, concurrency))
+        result.update(peak_rss_mb())
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    results.put(result)
+
+
+def run_isolated(mode, spec, iterations, concurrency):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_case, args=(mode, spec, iterations, concurrency, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+# ------------------------------
+# Reporting
+# ------------------------------
+def compare(old, new):
+    print(f"{'case':40} {'p50 old':>10} {'p50 new':>10} {'change':>8}", file=sys.stderr)
+    for key, result in new["results"].items():
+        before = old["results"].get(key, {})
+        if "p50_ms" not in result or "p50_ms" not in before:
+            continue
+        change = (result["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100
+        print(f"{key:40} {before['p50_ms']:10.1f} {result['p50_ms']:10.1f} {change:+7.1f}%", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("in_process", "http", "all"), default="all")
+    parser.add_argument("--only", help="run only cases whose name contains this")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent HTTP requests")
+    parser.add_argument("--quick", action="store_true", help="smaller fixtures")
+    parser.add_argument("--ppt", help="a .ppt file to benchmark the Java extractor with")
+    parser.add_argument("--fixtures", help="directory to write fixtures to (kept afterwards)")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON output to compare p50 latency against")
+    args = parser.parse_args()
+
+    sizes = {name: max(1, size // 10) if args.quick else size for name, size in SIZES.items()}
+    modes = ("in_process", "http") if args.mode == "all" else (args.mode,)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fixture_dir = args.fixtures or tmp_dir
+        os.makedirs(fixture_dir, exist_ok=True)
+        sys.path.insert(0, ROOT)
+        fixtures = build_fixtures(fixture_dir, sizes)
+        cases = define_cases(fixtures, args.ppt, sizes)
+
+        results = {}
+        for name, (problem, spec) in cases.items():
+            if args.only and args.only not in name:
+                continue
+            for mode in modes:
+                key = f"{mode}/{name}"
+                print(f"running {key}", file=sys.stderr)
+                if problem is not None:
+                    results[key] = {"skipped": problem}
+                    continue
+                results[key] = run_isolated(mode, spec, args.iterations, args.concurrency)
+
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": sizes,
+            "fixture_bytes": {name: os.path.getsize(path) for name, path in fixtures.items()},
+            "settings": {
+                name: os.environ[name]
+                for name in sorted(os.environ)
+                if name.startswith(("OCR_", "PDF_", "PPT", "DOCX_", "EXTRACT_", "JOB_", "BATCH_"))
+            },
+            "results": results,
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
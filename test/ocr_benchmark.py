@@ -0,0 +1,117 @@
+"""
+OCR latency vs. accuracy for each image preprocessing configuration.
+
+Usage:
+    python test/ocr_benchmark.py                      # generated sample images
+    python test/ocr_benchmark.py scan.png:scan.txt    # your own image + expected text
+
+Accuracy is the similarity (0-1) between the OCR output and the expected text.
+"""
+import difflib
+import os
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import app  # noqa: E402
+
+CONFIGS = [
+    "",
+    "downscale",
+    "downscale,blank",
+    "downscale,binarize",
+    "downscale,deskew",
+    "downscale,binarize,deskew,blank",
+]
+
+SAMPLE_LINES = [
+    "Computer Security Concepts",
+    "Threats, Attacks, and Assets",
+    "Security Functional Requirements",
+    "Fundamental Security Design Principles",
+    "Attack Surfaces and Attack Trees",
+    "The quick brown fox jumps over the lazy dog 0123456789",
+]
+
+
+def load_font(size):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default(size=size)
+
+
+def render_page(size, font_size, lines):
+    page = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(page)
+    font = load_font(font_size)
+    for i, line in enumerate(lines):
+        draw.text((font_size * 3, font_size * (3 + 2 * i)), line, fill=0, font=font)
+    return page
+
+
+def sample_images():
+    lines = SAMPLE_LINES * 4
+    truth = "\n".join(lines)
+
+    scan = render_page((2480, 3508), 42, lines)
+    scan.info["dpi"] = (300, 300)
+    yield "scan-300dpi", scan, truth
+
+    skewed = scan.rotate(3, expand=True, fillcolor=255)
+    yield "scan-skewed-3deg", skewed, truth
+
+    # 12 MP phone photo: large, grey paper, uneven lighting, noise, blur
+    photo = render_page((3024, 4032), 52, lines).rotate(-1.5, fillcolor=255)
+    shade = Image.linear_gradient("L").resize(photo.size).point(lambda v: 200 + v // 5)
+    photo = Image.composite(shade, photo, photo)
+    noise = Image.effect_noise(photo.size, 40)
+    photo = Image.blend(photo, noise, 0.1).filter(ImageFilter.GaussianBlur(1.2))
+    yield "phone-photo-12mp", photo.convert("RGB"), truth
+
+    # Title slides and chapter dividers: almost no ink, but not blank
+    heading = render_page((1654, 2339), 40, ["Chapter 1"])
+    heading.info["dpi"] = (200, 200)
+    yield "heading-only", heading, "Chapter 1"
+
+    yield "blank-page", Image.new("L", (2480, 3508), 245), ""
+
+
+def user_images(args):
+    for arg in args:
+        image_path, truth_path = arg.split(":", 1)
+        with open(truth_path, encoding="utf-8") as f:
+            truth = f.read()
+        yield os.path.basename(image_path), Image.open(image_path), truth
+
+
+def accuracy(text, truth):
+    text, truth = " ".join(text.split()), " ".join(truth.split())
+    if not truth:
+        return 1.0 if not text else 0.0
+    return difflib.SequenceMatcher(None, text, truth).ratio()
+
+
+def main():
+    samples = list(user_images(sys.argv[1:]) if sys.argv[1:] else sample_images())
+
+    print(f"{'config':36} {'image':20} {'seconds':>8} {'accuracy':>9}")
+    for config in CONFIGS:
+        app.OCR_PREPROCESS = frozenset(filter(None, config.split(",")))
+        total_time = total_acc = 0.0
+        for name, image, truth in samples:
+            start = time.perf_counter()
+            text = app.ocr_image(image)
+            elapsed = time.perf_counter() - start
+            acc = accuracy(text, truth)
+            total_time += elapsed
+            total_acc += acc
+            print(f"{config or '(none)':36} {name:20} {elapsed:8.2f} {acc:9.3f}")
+        print(f"{config or '(none)':36} {'mean':20} {total_time / len(samples):8.2f} {total_acc / len(samples):9.3f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Checks that the .pptx and .docx fast paths read the same text as
+python-pptx and python-docx, their fallbacks.
+
+Usage:
+    python test/ooxml_fast_path_check.py                  # generated files
+    python test/ooxml_fast_path_check.py a.pptx b.docx    # your own files
+
+Generated decks have grouped (and nested group) shapes, tables, line breaks,
+empty paragraphs and a reordered slide list. For .docx, python-docx only
+reads body paragraphs, so the generated document has no tables, headers or
+notes, and with your own files the fast path only has to start with the
+python-docx text. Exits with status 1 on any difference.
+"""
+import io
+import os
+import sys
+
+from docx import Document
+from docx.enum.text import WD_BREAK
+from pptx import Presentation
+from pptx.util import Inches
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import app  # noqa: E402
+
+
+def generated_pptx():
+    prs = Presentation()
+    for n in range(6):
+        slide = prs.slides.add_slide(prs.slide_layouts[1 if n % 2 else 5])
+        if slide.shapes.title is not None:
+            slide.shapes.title.text = f"Title {n}"
+
+        frame = slide.shapes.add_textbox(Inches(1), Inches(1), Inches(3), Inches(1)).text_frame
+        frame.text = f"Line {n}\vafter a line break"
+        frame.add_paragraph().text = ""
+        paragraph = frame.add_paragraph()
+        paragraph.add_run().text = "first run, "
+        paragraph.add_run().text = "second run & <markup>"
+
+        group = slide.shapes.add_group_shape()
+        group.shapes.add_textbox(Inches(1), Inches(2), Inches(1), Inches(1)).text_frame.text = f"grouped {n}"
+        nested = group.shapes.add_group_shape()
+        nested.shapes.add_textbox(0, 0, Inches(1), Inches(1)).text_frame.text = "nested group"
+
+        table = slide.shapes.add_table(2, 3, Inches(1), Inches(3), Inches(4), Inches(1)).table
+        for row in range(2):
+            for column in range(3):
+                if (row + column) % 2:
+                    table.cell(row, column).text = f"cell {row}{column}\nsecond paragraph"
+
+        slide.shapes.add_connector(1, 0, 0, Inches(1), Inches(1))
+
+    # Slide order comes from sldIdLst, not from the part names
+    slide_ids = prs.slides._sldIdLst
+    last = slide_ids[-1]
+    slide_ids.remove(last)
+    slide_ids.insert(0, last)
+
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    return "generated.pptx", buffer.getvalue()
+
+
+def generated_docx():
+    doc = Document()
+    doc.add_paragraph("Tab\tseparated")
+    paragraph = doc.add_paragraph()
+    paragraph.add_run("line one")
+    paragraph.add_run().add_break()
+    paragraph.add_run("line two")
+    paragraph.add_run().add_break(WD_BREAK.PAGE)
+    paragraph.add_run("after a page break")
+    doc.add_paragraph("")
+    doc.add_paragraph("Last paragraph & <markup>")
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return "generated.docx", buffer.getvalue()
+
+
+def pptx_slides(data, fast_path):
+    app.PPTX_FAST_PATH = fast_path
+    try:
+        return list(app._iter_pptx_slides(data, pictures=False, skip=()))
+    finally:
+        app.PPTX_FAST_PATH = True
+
+
+def docx_text(data, fast_path):
+    app.DOCX_FAST_PATH = fast_path
+    try:
+        return app.extract_docx_text(data)
+    finally:
+        app.DOCX_FAST_PATH = True
+
+
+def check_pptx(name, data):
+    fast = list(app.iter_pptx_slides_fast(data))
+    slow = pptx_slides(data, fast_path=False)
+    problems = []
+    if len(fast) != len(slow):
+        problems.append(f"{len(fast)} slides, python-pptx read {len(slow)}")
+    for fast_slide, slow_slide in zip(fast, slow):
+        if fast_slide != slow_slide:
+            problems.append(f"slide {slow_slide['slide']}: {fast_slide!r} != {slow_slide!r}")
+    return problems
+
+
+def check_docx(name, data, exact):
+    fast = app.extract_docx_text_fast(data)
+    slow = docx_text(data, fast_path=False)
+    if fast == slow or (not exact and fast.startswith(slow)):
+        return []
+    return [f"{fast!r} != {slow!r}"]
+
+
+def main():
+    if sys.argv[1:]:
+        files = []
+        for path in sys.argv[1:]:
+            with open(path, "rb") as f:
+                files.append((path, f.read()))
+        exact = False
+    else:
+        files = [generated_pptx(), generated_docx()]
+        exact = True
+
+    failed = False
+    for name, data in files:
+        if name.lower().endswith(".pptx"):
+            problems = check_pptx(name, data)
+        elif name.lower().endswith(".docx"):
+            problems = check_docx(name, data, exact)
+        else:
+            print(f"{name}: skipped (not .pptx or .docx)")
+            continue
+
+        print(f"{name}: {'differs' if problems else 'same text'}")
+        for problem in problems:
+            print(f"  {problem}")
+        failed = failed or bool(problems)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
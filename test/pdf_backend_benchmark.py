@@ -0,0 +1,96 @@
+"""
+Compares the PDF text backends (pages/second and text extracted).
+
+Usage:
+    python test/pdf_backend_benchmark.py                  # generated text PDFs
+    python test/pdf_backend_benchmark.py a.pdf b.pdf      # your own PDFs
+    python test/pdf_backend_benchmark.py --output pdf.json
+
+Backends whose tools are missing (pdftotext) are reported as skipped.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import app  # noqa: E402
+from benchmark import sample_lines, write_text_pdf  # noqa: E402
+
+
+def generated_pdfs(directory):
+    lines = sample_lines()
+    for pages, lines_per_page in ((10, 50), (200, 50), (50, 200)):
+        path = os.path.join(directory, f"text_{pages}p_{lines_per_page}l.pdf")
+        write_text_pdf(path, [
+            [lines[(page * lines_per_page + i) % len(lines)] for i in range(lines_per_page)]
+            for page in range(pages)
+        ])
+        yield path
+
+
+def measure(backend, path, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        total, page_texts = backend.read(path)
+        texts = list(page_texts)
+        timings.append(time.perf_counter() - start)
+
+    best = min(timings)
+    return {
+        "pages": total,
+        "chars": sum(len(text.strip()) for text in texts),
+        "best_seconds": round(best, 4),
+        "pages_per_second": round(total / best, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--output", help="write JSON here as well")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = args.pdfs or list(generated_pdfs(tmp_dir))
+        for path in paths:
+            name = os.path.basename(path)
+            results[name] = {}
+            for backend_name, backend in app.PDF_TEXT_BACKENDS.items():
+                if backend_name == "pdftotext" and shutil.which("pdftotext") is None:
+                    results[name][backend_name] = {"skipped": "pdftotext not found"}
+                    continue
+                try:
+                    results[name][backend_name] = measure(backend, path, args.iterations)
+                except Exception as e:
+                    results[name][backend_name] = {"error": f"{type(e).__name__}: {e}"}
+
+    print(f"{'pdf':28} {'backend':10} {'pages':>6} {'pages/s':>9} {'chars':>9}", file=sys.stderr)
+    for name, backends in results.items():
+        for backend_name, result in backends.items():
+            if "pages_per_second" in result:
+                print(
+                    f"{name:28} {backend_name:10} {result['pages']:6} "
+                    f"{result['pages_per_second']:9.1f} {result['chars']:9}",
+                    file=sys.stderr,
+                )
+            else:
+                print(f"{name:28} {backend_name:10} {next(iter(result.values()))}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()